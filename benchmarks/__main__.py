@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                 description="Runs the filling steps on a synthetic ontology against the replay API, "
+                                             "and reports their costs as JSON")
+parser.add_argument("--depth", type=int, default=3, help="depth of the food classes tree")
+parser.add_argument("--fanout", type=int, default=3, help="sub-classes per food class")
+parser.add_argument("--recipe-classes", type=int, default=4, help="sub-classes of Recipe")
+parser.add_argument("--instances", type=int, default=10, help="initial individuals per leaf food class")
+parser.add_argument("--recipes", type=int, default=10, help="recipes to ask for, per recipe class")
+parser.add_argument("--steps", type=str, default="1,2,3,4,5", help="comma-separated steps to run")
+parser.add_argument("--parallelism", type=int, default=1, help="concurrent AI queries")
+parser.add_argument("--latency", type=float, default=0, help="latency of synthetic answers, in seconds")
+parser.add_argument("--error-rate", type=float, default=0, help="rate of injected rate limit errors")
+parser.add_argument("--cache", choices=["yaml", "sqlite"], default="yaml", help="query cache type")
+parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic ontology")
+parser.add_argument("--directory", type=pathlib.Path, default=None,
+                    help="data directory to use (default: a new temporary one), reusing its query caches if any")
+parser.add_argument("--no-memory", action="store_true", help="do not trace memory, which slows everything down")
+parser.add_argument("--verbose", action="store_true", help="keep logging enabled")
+parser.add_argument("--output", type=pathlib.Path, default=None, help="JSON file for the report (default: stdout)")
+args = parser.parse_args()
+
+# settings are read upon import, hence they must be set before importing kgfiller's modules
+os.environ.update({
+    "API": "replay",
+    "REPLAY_API": "openai",
+    "MODEL": "gpt-3.5-turbo",
+    "N_RECIPES": str(args.recipes),
+    "PARALLELISM": str(args.parallelism),
+    "REPLAY_LATENCY": str(args.latency),
+    "REPLAY_ERROR_RATE": str(args.error_rate),
+    "BACKOFF_INITIAL": os.environ.get("BACKOFF_INITIAL", "0.01"),
+    "CACHE": args.cache,
+})
+
+import git
+
+from kgfiller import logger
+import kgfiller.ai as ai
+import kgfiller.ai.replay as replay
+import kgfiller.pipeline as pipeline
+import kgfiller.strategies as strategies
+from kgfiller.git import DataRepository
+from kgfiller.kg import KnowledgeGraph
+from kgfiller.text import itemize
+from kgfiller.utils import load_queries_yaml
+from benchmarks.ontology import synthetic_ontology
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, function: typing.Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "seconds": round(self.seconds, 6)}
+
+
+TIMERS: typing.Dict[str, Timer] = dict()
+
+
+def timer(name: str) -> Timer:
+    return TIMERS.setdefault(name, Timer())
+
+
+class TimedKnowledgeGraph(KnowledgeGraph):
+    def save(self, force: bool = False, export: bool = True) -> None:
+        if self.dirty or (export and self._unexported > 0) or force:
+            timer("save")(super().save, force, export)
+
+    def add_instances(self, *args, **kwargs):
+        return timer("add_instances")(super().add_instances, *args, **kwargs)
+
+    def add_property(self, *args, **kwargs):
+        return timer("add_property")(super().add_property, *args, **kwargs)
+
+    def merge_instances(self, *args, **kwargs):
+        return timer("merge_instances")(super().merge_instances, *args, **kwargs)
+
+
+class TimedDataRepository(DataRepository):
+    def flush(self) -> bool:
+        return timer("commit")(super().flush)
+
+
+def _timed_function(module, name: str):
+    function = getattr(module, name)
+    setattr(module, name, lambda *args, **kwargs: timer(name)(function, *args, **kwargs))
+
+
+_timed_function(strategies, "ai_query")
+_timed_function(pipeline, "gather_possible_duplicates")
+_timed_function(pipeline, "gather_all_instances_of_class_without_subclasses")
+
+
+def _snapshot(kg: KnowledgeGraph) -> dict:
+    snapshot = {name: t.to_dict() for name, t in TIMERS.items()}
+    snapshot["llm_calls"] = replay.stats.total_api_calls
+    snapshot["injected_errors"] = replay.stats.injected_errors
+    if isinstance(ai.query_cache(), ai.MemoryQueryCache):
+        snapshot["memo_hits"] = ai.query_cache().stats.hits
+        snapshot["memo_misses"] = ai.query_cache().stats.misses
+    return snapshot
+
+
+def _difference(after, before):
+    if isinstance(after, dict):
+        return {k: _difference(v, before.get(k, 0 if not isinstance(v, dict) else {})) for k, v in after.items()}
+    return round(after - before, 6) if isinstance(after, float) else after - before
+
+
+def main():
+    if not args.verbose:
+        logger.verbose = False
+        logger.disable_file_output()
+    directory = args.directory or pathlib.Path(tempfile.mkdtemp(prefix="kgfiller-benchmark-"))
+    directory.mkdir(parents=True, exist_ok=True)
+    ontology = directory / "ontology.owl"
+    synthetic_ontology(ontology, depth=args.depth, fanout=args.fanout, recipe_classes=args.recipe_classes,
+                       instances=args.instances, seed=args.seed)
+    repo = git.Repo.init(directory)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "kgfiller benchmark")
+        config.set_value("user", "email", "benchmark@kgfiller")
+    repo.git.add(ontology.name)
+    repo.git.commit("-m", "begin")
+    ai.load_cache_from_env(directory=directory)
+    queries = load_queries_yaml()
+    # loads linguistic resources once for all, so that they do not weigh on the first step
+    itemize("1. apple")
+    selected = [int(step) for step in args.steps.split(",")]
+    report = {"parameters": {k: str(v) if isinstance(v, pathlib.Path) else v for k, v in vars(args).items()},
+              "directory": str(directory), "steps": []}
+    total_start = time.perf_counter()
+    with TimedDataRepository(directory) as repo, TimedKnowledgeGraph(ontology) as kg:
+        report["initial_individuals"] = len(list(kg.onto.individuals()))
+        for index, step in enumerate(pipeline.STEPS, start=1):
+            if index not in selected:
+                continue
+            print(f"Running step {index} ({step.__name__})...", file=sys.stderr)
+            before = _snapshot(kg)
+            if not args.no_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            step(kg, repo, queries)
+            pipeline.export(kg, repo, step)
+            elapsed = time.perf_counter() - start
+            result = {"step": index, "name": step.__name__, "wall_time": round(elapsed, 6)}
+            if not args.no_memory:
+                result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            result.update(_difference(_snapshot(kg), before))
+            result["individuals"] = len(list(kg.onto.individuals()))
+            result["ontology_bytes"] = ontology.stat().st_size
+            report["steps"].append(result)
+    ai.query_cache().close()
+    report["wall_time"] = round(time.perf_counter() - total_start, 6)
+    report["commits"] = int(repo.git.rev_list("--count", "HEAD"))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+
+
+main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import owlready2 as owlready
+
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks.formats",
+                                 description="Compares the formats the ontology can be saved in, in terms of "
+                                             "serialisation time, file size, loading time, and size of the line-based "
+                                             "diff caused by adding one individual, and reports them as JSON")
+parser.add_argument("ontologies", type=pathlib.Path, nargs="+",
+                    help="ontologies to save, e.g. filled by `python -m benchmarks --directory ...`")
+parser.add_argument("--repeat", type=int, default=3, help="times each measurement is repeated, keeping the best one")
+parser.add_argument("--output", type=pathlib.Path, default=None, help="JSON file for the report (default: stdout)")
+args = parser.parse_args()
+
+from kgfiller import logger
+from kgfiller.kg import SAVE_FORMATS, save_ontology
+
+
+def _load(path: pathlib.Path) -> owlready.Ontology:
+    # a new world per load, as loading the same ontology twice in a world does nothing
+    return owlready.World().get_ontology(path.as_uri()).load()
+
+
+def _best(function: typing.Callable[[], typing.Any]) -> float:
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return round(best, 6)
+
+
+def _diff_lines(before: pathlib.Path, after: pathlib.Path) -> int:
+    numstat = subprocess.run(["git", "diff", "--no-index", "--numstat", str(before), str(after)],
+                             capture_output=True, text=True).stdout.split()
+    return int(numstat[0]) + int(numstat[1]) if numstat else 0
+
+
+def compare(ontology: pathlib.Path, directory: pathlib.Path) -> dict:
+    onto = _load(ontology)
+    result = {"ontology": str(ontology), "triples": len(list(onto.get_triples())),
+              "individuals": len(list(onto.individuals())), "formats": {}}
+    for format in SAVE_FORMATS:
+        path = directory / f"{ontology.stem}.{format}"
+        measures = {"save_time": _best(lambda: save_ontology(onto, path, format)),
+                    "bytes": path.stat().st_size,
+                    "load_time": _best(lambda: _load(path))}
+        edited = _load(path)
+        individual = next(edited.individuals())
+        with edited:
+            individual.is_a[0]("benchmark_individual")
+        edited_path = directory / f"{ontology.stem}.edited.{format}"
+        save_ontology(edited, edited_path, format)
+        measures["edit_diff_lines"] = _diff_lines(path, edited_path)
+        result["formats"][format] = measures
+    return result
+
+
+def main():
+    logger.verbose = False
+    logger.disable_file_output()
+    with tempfile.TemporaryDirectory(prefix="kgfiller-formats-") as directory:
+        report = [compare(ontology, pathlib.Path(directory)) for ontology in args.ontologies]
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output, file=sys.stdout)
+
+
+main()
@@ -0,0 +1,62 @@
+import pathlib
+import random
+
+import owlready2 as owlready
+
+from kgfiller.ai.replay import FOODS, DISHES, ADJECTIVES
+
+
+def _instance_names(rnd: random.Random, vocabulary, amount: int):
+    names = set()
+    while len(names) < amount:
+        name = rnd.choice(vocabulary)
+        if rnd.random() < 0.7:
+            name = f"{rnd.choice(ADJECTIVES)} {name}"
+        if name in names:
+            name = f"{name} {len(names)}"
+        names.add(name)
+    return sorted(names)
+
+
+def synthetic_ontology(path: pathlib.Path,
+                       depth: int = 3,
+                       fanout: int = 3,
+                       recipe_classes: int = 4,
+                       instances: int = 10,
+                       seed: int = 0) -> pathlib.Path:
+    """Writes into `path` an ontology shaped like the food one: a tree of food classes with the given `depth` and
+    `fanout` under the root class Edible, plus `recipe_classes` sub-classes of Recipe. Each food class gets
+    `instances` individuals (half of them for non-leaf classes)."""
+    rnd = random.Random(seed)
+    world = owlready.World()
+    onto = world.get_ontology("http://www.example.org/kgfiller/benchmark.owl#")
+    with onto:
+        class Edible(owlready.Thing):
+            pass
+
+        class fancyName(owlready.AnnotationProperty):
+            pass
+
+        class ingredientOf(owlready.ObjectProperty):
+            pass
+
+        class Recipe(Edible):
+            pass
+
+        def add_classes(parent, prefix: str, level: int):
+            for i in range(fanout):
+                name = f"{prefix}{i + 1}"
+                cls = owlready.types.new_class(name, (parent,))
+                leaf = level == depth
+                if not leaf:
+                    add_classes(cls, f"{name}_", level + 1)
+                for individual in _instance_names(rnd, FOODS, instances if leaf else instances // 2):
+                    instance = cls(individual.replace(" ", "_"))
+                    instance.fancyName.append(individual)
+
+        add_classes(Edible, "Food", 1)
+        for i in range(recipe_classes):
+            owlready.types.new_class(f"{rnd.choice(DISHES).capitalize()}{i + 1}", (Recipe,))
+    onto.save(str(path))
+    world.close()
+    return path
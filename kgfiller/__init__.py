@@ -4,7 +4,27 @@ import re
 import typing
 import os
 import sys
-from .utils import get_env_var
+from .utils import get_env_var, forward_settings_to
+
+
+class _DeferredFileHandler(logging.FileHandler):
+    """File handler creating neither its directory nor its file until the first record, so that merely importing
+    kgfiller has no effect on the file system."""
+
+    def __init__(self, filename):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        log_dir = os.path.dirname(self.baseFilename)
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+        except OSError:
+            print(f'{self.__class__.__name__}: Cannot create directory {log_dir}. ',
+                  end='', file=sys.stderr)
+            log_dir = '/tmp' if sys.platform.startswith('linux') else '.'
+            print(f'Defaulting to {log_dir}.', file=sys.stderr)
+            self.baseFilename = os.path.join(os.path.abspath(log_dir), os.path.basename(self.baseFilename))
+        return super()._open()
 
 class SmartLogger(logging.getLoggerClass()):
     def __init__(self, name, verbose, log_dir='logs'):
@@ -43,6 +63,9 @@ class SmartLogger(logging.getLoggerClass()):
         self.stdout_handler.setFormatter(logging.Formatter('%(asctime)s | %(name)s | %(levelname)9s | %(message)s'))
         self.enable_console_output()
 
+        # settings read so far are logged right before the first record, see utils.forward_settings_to
+        self._settings_forwarded = False
+
         self.file_handler = None
         if log_dir:
             self.log_dir = log_dir
@@ -55,22 +78,18 @@ class SmartLogger(logging.getLoggerClass()):
         fmt = '%(asctime)s | %(name)s | %(levelname)9s | %(message)s'
         formatter = logging.Formatter(fmt)
 
-        if not os.path.exists(self.log_dir):
-            try:
-                os.makedirs(self.log_dir)
-            except:
-                print(f'{self.__class__.__name__}: Cannot create directory {self.log_dir}. ',
-                      end='', file=sys.stderr)
-                self.log_dir = '/tmp' if sys.platform.startswith('linux') else '.'
-                print(f'Defaulting to {self.log_dir}.', file=sys.stderr)
-        log_file = self.get_log_file()
-
-        # Create file handler for logging to a file (log all five levels)
-        self.file_handler = logging.FileHandler(log_file)
+        # Create file handler for logging to a file (log all five levels), creating it upon the first record
+        self.file_handler = _DeferredFileHandler(self.get_log_file())
         self.file_handler.setLevel(logging.DEBUG)
         self.file_handler.setFormatter(formatter)
         self.addHandler(self.file_handler)
 
+    def handle(self, record):
+        if not self._settings_forwarded:
+            self._settings_forwarded = True
+            forward_settings_to(self)
+        super().handle(record)
+
     def get_log_file(self):
         return "{}/{}.log".format(self.log_dir, self.name)
 
@@ -158,7 +177,6 @@ logger = SmartLogger(exp_name, True)
 
 
 PATH_DATA_DIR = pathlib.Path(__file__).parent.parent / "data"
-logger.debug("PATH_DATA_DIR = %s", PATH_DATA_DIR.absolute())
 
 
 ESCAPED = str.maketrans({"\n":  r"\n", "\n":  r"\n"})
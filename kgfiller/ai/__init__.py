@@ -1,13 +1,16 @@
 import os
 import pathlib
-import time
+import threading
 import typing
+from concurrent.futures import Future
 from dataclasses import dataclass
 
 import yaml
 from lazy_property import LazyProperty
 
 from kgfiller import logger, PATH_DATA_DIR
+from kgfiller.ai.cache import QueryCache, MemoryQueryCache, CacheRecord, CACHES, DEFAULT_MEMO_ENTRIES, encode
+from kgfiller.ai.ratelimit import Backoff, RateLimiter, rate_limiter, retry_after
 from kgfiller.text import itemize, str_hash, Item
 from kgfiller.utils import get_env_var
 
@@ -16,6 +19,33 @@ DEFAULT_BACKGROUND = get_env_var("BACKGROUND", "You're a dietician", "AI backgro
 DEFAULT_LIMIT = int(get_env_var("LIMIT", "100", "AI prompt limit"))
 
 
+_in_flight: typing.Dict[str, Future] = dict()
+_in_flight_lock = threading.Lock()
+
+
+def _single_flight(key: str, function: typing.Callable[[], typing.Any]) -> typing.Any:
+    """Calls `function` unless another thread is already calling it for the same `key`,
+    in which case that call's outcome is awaited and returned instead."""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        logger.debug("Waiting for query %s, which is already being performed", key)
+        return future.result()
+    try:
+        result = function()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise e
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
 @dataclass
 class AiQuery:
     question: str
@@ -31,10 +61,16 @@ class AiQuery:
     def _limit_error(cls) -> typing.Type[Exception] | typing.Iterable[typing.Type[Exception]]:
         ...
 
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return rate_limiter(type(self).__module__.split(".")[-1], self.model)
+
     @LazyProperty
     def _chat_completion(self):
-        timeout = 30  # seconds
+        limiter = self.rate_limiter
+        backoff = Backoff()
         while True:
+            limiter.acquire(tokens=self.limit)
             try:
                 return self._chat_completion_step()
             except Exception as e:
@@ -42,22 +78,32 @@ class AiQuery:
                 if not isinstance(errors, typing.Iterable):
                     errors = [errors]
                 if any(isinstance(e, t) for t in errors):
+                    timeout = retry_after(e) or backoff.next()
                     logger.warning("Encountered and catched error: {}".format(e))
-                    logger.warning("Rate limit exceeded, retrying in {} seconds".format(timeout))
-                    time.sleep(timeout)
-                    timeout *= 1.5
+                    logger.warning("Rate limit exceeded, retrying in {:.1f} seconds".format(timeout))
+                    limiter.pause(timeout)
                 else:
                     raise e
 
+    def _id(self, api: str) -> str:
+        fields = [self.question, self.model, self.limit, self.background, api]
+        return "query#" + "#".join([str(f) for f in fields if f is not None])
+
     @property
     def id(self):
-        fields = [self.question, self.model, self.limit, self.background, self.api]
-        return "query#" + "#".join([str(f) for f in fields if f is not None])
+        return self._id(self.api)
+
+    @property
+    def cache(self) -> QueryCache:
+        return query_cache()
+
+    @LazyProperty
+    def cache_key(self) -> str:
+        return str_hash(self.id)
 
     @LazyProperty
     def cache_path(self) -> pathlib.Path:
-        id = str_hash(self.id)
-        return PATH_DATA_DIR / f"cache-{id}.yml"
+        return self.cache.path(self.cache_key)
 
     def _chat_completion_to_dict(self, chat_completion) -> str:
         ...
@@ -67,31 +113,33 @@ class AiQuery:
         return self.__class__.__name__
 
     def _cache(self):
-        overwrite = self.cache_path.exists()
+        overwrite = self.cache_key in self.cache
         verb = "Overwriting cache of" if overwrite else "Caching"
         logger.debug("%s query `%s` into file %s", verb, self, self.cache_path.absolute())
         completion = self._chat_completion_to_dict(self._chat_completion)
-        with open(self.cache_path, "w") as f:
-            print(f"# Cache for query: {self.question}", file=f)
-            print(f"# (api: {self.api}, model: {self.model}, background: '{self.background}', limit: {self.limit}", end='', file=f)
-            print(f", attempt: {self.attempt})" if self.attempt is not None else ')', file=f)
-            yaml.dump(completion, f)
+        header = f"Cache for query: {self.question}\n" \
+                 f"(api: {self.api}, model: {self.model}, background: '{self.background}', limit: {self.limit}"
+        header += f", attempt: {self.attempt})" if self.attempt is not None else ')'
+        self.cache.put(CacheRecord(self.cache_key, header, encode(completion)))
 
     def _parse_cache(self) -> dict:
-        logger.debug("Parsing cache file %s", self.cache_path.absolute())
-        if not self.cache_path.exists():
-            raise FileNotFoundError(f"Cache file {self.cache_path.absolute()} does not exist")
-        with open(self.cache_path, "r") as f:
-            try:
-                return yaml.safe_load(f)
-            except yaml.YAMLError:
-                logger.warning("Removing invalid cache file %s", self.cache_path.absolute())
-                self.cache_path.unlink()
-                return None
+        logger.debug("Parsing cache of query %s from file %s", self.cache_key, self.cache_path.absolute())
+        record = self.cache.get(self.cache_key)
+        if record is None:
+            raise FileNotFoundError(f"Cache of query {self.cache_key} does not exist in {self.cache_path.absolute()}")
+        try:
+            return record.completion
+        except yaml.YAMLError:
+            logger.warning("Removing invalid cache of query %s from file %s", self.cache_key, self.cache_path.absolute())
+            self.cache.discard(self.cache_key)
+            return None
 
     @LazyProperty
     def result(self):
-        if not self.cache_path.exists():
+        return _single_flight(self.cache_key, self._cached_or_new_result)
+
+    def _cached_or_new_result(self):
+        if self.cache_key not in self.cache:
             self._cache()
             return self._chat_completion
         else:
@@ -109,12 +157,13 @@ class AiQuery:
 
 
 DEFAULT_API: type = None
+# guards the lazy loading of DEFAULT_API and DEFAULT_CACHE, as queries may be performed by worker threads
+_defaults_lock = threading.RLock()
 
 
 def ai_query(question: str, model: str = None, limit: int = None, attempt: int = None, background: str = None, api: type = None) -> AiQuery:
     if api is None:
-        global DEFAULT_API
-        api = DEFAULT_API
+        api = default_api()
     limit = limit or DEFAULT_LIMIT
     return api(
         question=question,
@@ -125,18 +174,55 @@ def ai_query(question: str, model: str = None, limit: int = None, attempt: int =
     )
 
 
+DEFAULT_CACHE: QueryCache = None
+
+
+def load_cache_from_env(variable_name="CACHE", default_cache="yaml", directory: pathlib.Path = PATH_DATA_DIR) -> QueryCache:
+    global DEFAULT_CACHE
+    with _defaults_lock:
+        cache = get_env_var(variable_name, default_cache, "query cache type")
+        if cache not in CACHES:
+            raise ValueError("Unknown query cache: " + cache)
+        if DEFAULT_CACHE is not None:
+            DEFAULT_CACHE.close()
+        DEFAULT_CACHE = CACHES[cache].in_directory(directory)
+        if DEFAULT_MEMO_ENTRIES > 0:
+            DEFAULT_CACHE = MemoryQueryCache(DEFAULT_CACHE)
+        logger.debug(f"Using query cache: {type(DEFAULT_CACHE).__name__} from environment variable: {variable_name}")
+        return DEFAULT_CACHE
+
+
+def query_cache() -> QueryCache:
+    if DEFAULT_CACHE is None:
+        with _defaults_lock:
+            if DEFAULT_CACHE is None:
+                return load_cache_from_env()
+    return DEFAULT_CACHE
+
+
+def default_api() -> type:
+    if DEFAULT_API is None:
+        with _defaults_lock:
+            if DEFAULT_API is None:
+                load_api_from_env()
+    return DEFAULT_API
+
+
 def load_api_from_env(variable_name="API", default_api="almaai"):
-    api = get_env_var(variable_name, default_api, "API type")
-    if api == "almaai":
-        import kgfiller.ai.openai as api
-        api.almmai_endpoint()
-    elif api == "openai":
-        import kgfiller.ai.openai as api
-    elif api == "hugging":
-        import kgfiller.ai.hugging as api
-    elif api == "anthropic":
-        import kgfiller.ai.anthropic as api
-    else:
-        raise ValueError("Unknown API: " + api)
-    logger.debug(f"Using API: {api.__name__} from environment variable: {variable_name}")
-    return api
+    with _defaults_lock:
+        api = get_env_var(variable_name, default_api, "API type")
+        if api == "almaai":
+            import kgfiller.ai.openai as api
+            api.almmai_endpoint()
+        elif api == "openai":
+            import kgfiller.ai.openai as api
+        elif api == "hugging":
+            import kgfiller.ai.hugging as api
+        elif api == "anthropic":
+            import kgfiller.ai.anthropic as api
+        elif api == "replay":
+            import kgfiller.ai.replay as api
+        else:
+            raise ValueError("Unknown API: " + api)
+        logger.debug(f"Using API: {api.__name__} from environment variable: {variable_name}")
+        return api
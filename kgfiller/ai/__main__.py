@@ -1,5 +1,5 @@
 
-from kgfiller.ai import ai_query, load_api_from_env
+from kgfiller.ai import ai_query, load_api_from_env, query_cache, MemoryQueryCache
 
 
 api = load_api_from_env()
@@ -12,6 +12,8 @@ while True:
         print(query.result_text)
         print("> itemized results:", query.result_to_list())
         api.stats.print()
+        if isinstance(query_cache(), MemoryQueryCache):
+            query_cache().stats.print()
     except EOFError:
         break
     except KeyboardInterrupt:
@@ -54,10 +54,14 @@ class AnthropicAiQuery(ai.AiQuery):
         return anthropic.APITimeoutError
 
     def _chat_completion_to_dict(self, chat_completion) -> dict:
-        ...
+        return {
+            'completion': chat_completion.completion,
+        }
 
     def _extract_text_from_result(self, result) -> str:
-        return unescape(result)
+        if isinstance(result, dict):
+            return unescape(result['completion'])
+        return unescape(result.completion)
 
 
 ai.DEFAULT_API = AnthropicAiQuery
@@ -0,0 +1,397 @@
+import argparse
+import atexit
+import collections
+import json
+import pathlib
+import sqlite3
+import threading
+import typing
+from dataclasses import dataclass
+
+import yaml
+from lazy_property import LazyProperty
+
+from kgfiller import logger, PATH_DATA_DIR
+from kgfiller.utils import atomic_write, get_env_var
+
+
+DEFAULT_SQLITE_FILE = "cache.sqlite3"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_ENCODING = get_env_var("CACHE_ENCODING", "json", "query cache encoding")
+DEFAULT_MEMO_ENTRIES = int(get_env_var("MEMO_ENTRIES", "4096", "max amount of queries cached in memory"))
+DEFAULT_MEMO_SIZE = int(get_env_var("MEMO_SIZE", str(64 * 1024 * 1024), "max bytes of queries cached in memory"))
+
+# libyaml-based loader, if available, is way faster than the pure-Python one
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def encode(completion: dict, encoding: str = None) -> str:
+    encoding = encoding or DEFAULT_ENCODING
+    if encoding == "json":
+        # JSON is valid YAML as well, hence cache files remain readable by older versions
+        return json.dumps(completion, ensure_ascii=False, separators=(",", ":")) + "\n"
+    elif encoding == "yaml":
+        return yaml.dump(completion)
+    else:
+        raise ValueError("Unknown cache encoding: " + encoding)
+
+
+def decode(data: str) -> dict:
+    if data.lstrip().startswith(("{", "[")):
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            pass
+    return yaml.load(data, Loader=_YamlLoader)
+
+
+@dataclass
+class CacheRecord:
+    key: str
+    header: str
+    data: str
+
+    @LazyProperty
+    def completion(self) -> dict:
+        return decode(self.data)
+
+    @property
+    def size(self) -> int:
+        return len(self.key) + len(self.header) + len(self.data)
+
+
+class QueryCache:
+    """Store of AI answers, indexed by the hash of the queries' ids."""
+
+    @classmethod
+    def in_directory(cls, directory: pathlib.Path) -> "QueryCache":
+        return cls(directory)
+
+    def path(self, key: str) -> pathlib.Path:
+        """The file where the record for `key` is (or would be) stored, e.g. for committing it."""
+        raise NotImplementedError()
+
+    def __contains__(self, key: str) -> bool:
+        raise NotImplementedError()
+
+    def get(self, key: str) -> CacheRecord | None:
+        raise NotImplementedError()
+
+    def put(self, record: CacheRecord):
+        raise NotImplementedError()
+
+    def discard(self, key: str):
+        raise NotImplementedError()
+
+    def keys(self) -> typing.Iterable[str]:
+        raise NotImplementedError()
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, CacheRecord]:
+        records = ((key, self.get(key)) for key in keys)
+        return {key: record for key, record in records if record is not None}
+
+    def put_many(self, records: typing.Iterable[CacheRecord]):
+        for record in records:
+            self.put(record)
+
+    def sync(self):
+        """Ensures all records are written to the files returned by `path`."""
+        pass
+
+    def close(self):
+        self.sync()
+
+
+class YamlQueryCache(QueryCache):
+    """One `cache-<key>.yml` file per query, with the query details as header comments."""
+
+    def __init__(self, directory: pathlib.Path = PATH_DATA_DIR):
+        self._directory = directory
+
+    def path(self, key: str) -> pathlib.Path:
+        return self._directory / f"cache-{key}.yml"
+
+    def __contains__(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def get(self, key: str) -> CacheRecord | None:
+        path = self.path(key)
+        if not path.exists():
+            return None
+        with open(path, "r") as f:
+            lines = f.readlines()
+        header = []
+        while lines and lines[0].startswith("#"):
+            header.append(lines.pop(0)[1:].strip())
+        return CacheRecord(key, "\n".join(header), "".join(lines))
+
+    def put(self, record: CacheRecord):
+        # written aside, then renamed, so that readers never see partially written files
+        with atomic_write(self.path(record.key)) as f:
+            for line in record.header.splitlines():
+                print(f"# {line}", file=f)
+            f.write(record.data)
+
+    def discard(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def keys(self) -> typing.Iterable[str]:
+        for path in sorted(self._directory.glob("cache-*.yml")):
+            yield path.stem[len("cache-"):]
+
+
+class SqliteQueryCache(QueryCache):
+    """All queries in a single SQLite database, in WAL mode so that several writers may share it.
+
+    Writes are buffered, and flushed in a single transaction every `batch_size` records, or upon `sync`.
+    """
+
+    def __init__(self, path: pathlib.Path = PATH_DATA_DIR / DEFAULT_SQLITE_FILE, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._path = path
+        self._batch_size = batch_size
+        self._pending: typing.Dict[str, CacheRecord] = dict()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._connections: typing.List[sqlite3.Connection] = []
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS queries "
+                               "(key TEXT PRIMARY KEY, header TEXT NOT NULL, data TEXT NOT NULL)")
+        atexit.register(self.close)
+
+    @classmethod
+    def in_directory(cls, directory: pathlib.Path) -> "SqliteQueryCache":
+        return cls(directory / DEFAULT_SQLITE_FILE)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=60, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def path(self, key: str) -> pathlib.Path:
+        return self._path
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return True
+        row = self._connection().execute("SELECT 1 FROM queries WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> CacheRecord | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, CacheRecord]:
+        result = dict()
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._pending:
+                    result[key] = self._pending[key]
+                else:
+                    missing.append(key)
+        connection = self._connection()
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = connection.execute(f"SELECT key, header, data FROM queries WHERE key IN ({placeholders})", chunk)
+            for key, header, data in rows:
+                result[key] = CacheRecord(key, header, data)
+        return result
+
+    def put(self, record: CacheRecord):
+        self.put_many([record])
+
+    def put_many(self, records: typing.Iterable[CacheRecord]):
+        with self._lock:
+            for record in records:
+                self._pending[record.key] = record
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(r.key, r.header, r.data) for r in self._pending.values()]
+            with self._connection() as connection:
+                connection.executemany("INSERT OR REPLACE INTO queries (key, header, data) VALUES (?, ?, ?)", rows)
+            logger.debug("Flushed %d cache records into %s", len(rows), self._path.absolute())
+            self._pending.clear()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+            with self._connection() as connection:
+                connection.execute("DELETE FROM queries WHERE key = ?", (key,))
+
+    def keys(self) -> typing.Iterable[str]:
+        self._flush()
+        for (key,) in self._connection().execute("SELECT key FROM queries ORDER BY key"):
+            yield key
+
+    def sync(self):
+        self._flush()
+        # moves the write-ahead log into the main file, which is the only one to be committed
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            if not self._connections:
+                return
+            self.sync()
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+            self._local = threading.local()
+
+
+@dataclass
+class MemoStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def print(self, prefix: str = None):
+        if prefix:
+            print(prefix, end='')
+        print("memo hits:", self.hits, "memo misses:", self.misses, "memo evictions:", self.evictions, flush=True)
+
+
+class MemoryQueryCache(QueryCache):
+    """Bounded in-memory LRU cache in front of another query cache, which is still in charge of persistence.
+
+    Records are evicted as soon as there are more than `max_entries` of them, or their overall size exceeds
+    `max_size` bytes.
+    """
+
+    def __init__(self, backend: QueryCache, max_entries: int = DEFAULT_MEMO_ENTRIES, max_size: int = DEFAULT_MEMO_SIZE):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.stats = MemoStats()
+        self._records: typing.OrderedDict[str, CacheRecord] = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def _remember(self, record: CacheRecord):
+        with self._lock:
+            self._forget(record.key)
+            self._records[record.key] = record
+            self._size += record.size
+            while self._records and (len(self._records) > self.max_entries or self._size > self.max_size):
+                _, evicted = self._records.popitem(last=False)
+                self._size -= evicted.size
+                self.stats.evictions += 1
+
+    def _forget(self, key: str):
+        with self._lock:
+            record = self._records.pop(key, None)
+            if record is not None:
+                self._size -= record.size
+
+    def _recall(self, key: str) -> CacheRecord | None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                self.stats.misses += 1
+            else:
+                self._records.move_to_end(key)
+                self.stats.hits += 1
+            return record
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.backend.path(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records or key in self.backend
+
+    def get(self, key: str) -> CacheRecord | None:
+        record = self._recall(key)
+        if record is None:
+            record = self.backend.get(key)
+            if record is not None:
+                self._remember(record)
+        return record
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, CacheRecord]:
+        result = dict()
+        missing = []
+        for key in keys:
+            record = self._recall(key)
+            if record is None:
+                missing.append(key)
+            else:
+                result[key] = record
+        for key, record in self.backend.get_many(missing).items():
+            self._remember(record)
+            result[key] = record
+        return result
+
+    def put(self, record: CacheRecord):
+        self.backend.put(record)
+        self._remember(record)
+
+    def put_many(self, records: typing.Iterable[CacheRecord]):
+        records = list(records)
+        self.backend.put_many(records)
+        for record in records:
+            self._remember(record)
+
+    def discard(self, key: str):
+        self._forget(key)
+        self.backend.discard(key)
+
+    def keys(self) -> typing.Iterable[str]:
+        return self.backend.keys()
+
+    def sync(self):
+        self.backend.sync()
+
+    def close(self):
+        self.backend.close()
+
+
+CACHES = {
+    "yaml": YamlQueryCache,
+    "sqlite": SqliteQueryCache,
+}
+
+
+def copy_records(source: QueryCache, target: QueryCache, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    keys = list(source.keys())
+    for i in range(0, len(keys), batch_size):
+        target.put_many(source.get_many(keys[i:i + batch_size]).values())
+    target.sync()
+    return len(keys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m kgfiller.ai.cache",
+                                     description="Move cached AI answers between the YAML files and the SQLite store")
+    parser.add_argument("command", choices=["import", "export"],
+                        help="import: from cache-*.yml files into SQLite, export: from SQLite into cache-*.yml files")
+    parser.add_argument("--data-dir", type=pathlib.Path, default=PATH_DATA_DIR, help="directory of the YAML files")
+    parser.add_argument("--database", type=pathlib.Path, default=None, help="path of the SQLite store")
+    parser.add_argument("--delete", action="store_true", help="delete the YAML files after importing them")
+    args = parser.parse_args()
+    yaml_cache = YamlQueryCache(args.data_dir)
+    sqlite_cache = SqliteQueryCache(args.database or args.data_dir / DEFAULT_SQLITE_FILE)
+    if args.command == "import":
+        count = copy_records(yaml_cache, sqlite_cache)
+        if args.delete:
+            for key in list(yaml_cache.keys()):
+                if key in sqlite_cache:
+                    yaml_cache.discard(key)
+    else:
+        count = copy_records(sqlite_cache, yaml_cache)
+    sqlite_cache.close()
+    print(f"{args.command}ed {count} cache records")
@@ -1,3 +1,4 @@
+import threading
 import typing
 from dataclasses import dataclass
 import time
@@ -58,6 +59,10 @@ def _hugging_sign_in(username=username, password=password):
 
 
 _chatbot = None
+# the chatbot is shared, and it can only follow one conversation at a time: queries are serialised, whatever the
+# PARALLELISM. One chatbot per thread would not do either, since each query deletes the other conversations of the
+# account, which all chatbots share
+_chatbot_lock = threading.Lock()
 
 
 def _hugging_chat_bot(username=username, password=password):
@@ -89,7 +94,7 @@ class HuggingAiQuery(ai.AiQuery):
         return _hugging_chat_bot()
 
     def _new_conversation(self, chat_bot):
-        timeout = 30  # seconds
+        backoff = ai.Backoff()
         while True:
             try:
                 logger.debug('Trying to open new conversation...')
@@ -98,11 +103,11 @@ class HuggingAiQuery(ai.AiQuery):
                 logger.debug('New conversation opened successfully!')
                 break
             except Exception as e:
+                timeout = backoff.next()
                 logger.warning("Encountered and catched error: {}".format(e))
                 logger.warning('Unable to open new conversation with error "{}". '
-                                'Retrying in {} seconds...'.format(e, timeout))
+                                'Retrying in {:.1f} seconds...'.format(e, timeout))
                 time.sleep(timeout)
-                timeout *= 1.5
 
     def _select_llm(self, chat_bot):
         if self.model != chat_bot.active_model.name:
@@ -118,7 +123,7 @@ class HuggingAiQuery(ai.AiQuery):
         self._new_conversation(chat_bot)
 
     def close_conversations(self, chat_bot):
-        timeout = 30  # seconds
+        backoff = ai.Backoff()
         while True:
             try:
                 logger.debug('Trying to close conversations...')
@@ -133,22 +138,23 @@ class HuggingAiQuery(ai.AiQuery):
                 if isinstance(e, hugchat.exceptions.DeleteConversationError) and ('404' in str(e) or '504' in str(e)):
                     logger.warning("Skipping 404 and 504 errors, closing conversations next time...")
                     break
+                timeout = backoff.next()
                 logger.warning('Unable to delete all conversations with error "{}". '
-                            'Retrying in {} seconds...'.format(e, timeout))
+                            'Retrying in {:.1f} seconds...'.format(e, timeout))
                 time.sleep(timeout)
-                timeout *= 1.5
 
     def _chat_completion_step(self):
-        chat_bot = self._create_chatbot()
-        self._select_llm(chat_bot)
-        result = chat_bot.query(self.question,
-                                temperature = 0 if any([token in self.question for token in ['merge', 'duplicates']]) else None,
-                                truncate=self.limit)
-        result.wait_until_done()
-        logger.debug('result from hugging query: {}'.format(result))
-        stats.plus(result)
-        self.close_conversations(chat_bot)
-        return result
+        with _chatbot_lock:
+            chat_bot = self._create_chatbot()
+            self._select_llm(chat_bot)
+            result = chat_bot.query(self.question,
+                                    temperature = 0 if any([token in self.question for token in ['merge', 'duplicates']]) else None,
+                                    truncate=self.limit)
+            result.wait_until_done()
+            logger.debug('result from hugging query: {}'.format(result))
+            stats.plus(result)
+            self.close_conversations(chat_bot)
+            return result
 
     @classmethod
     def _limit_error(cls) -> typing.Iterable[typing.Type[Exception]]:
@@ -157,8 +163,6 @@ class HuggingAiQuery(ai.AiQuery):
     def _chat_completion_to_dict(self, chat_completion) -> dict:
         return {
             'text': chat_completion.text,
-            'error': chat_completion.error,
-            'msg_status': chat_completion.msg_status,
         }
 
     def _extract_text_from_result(self, result) -> str:
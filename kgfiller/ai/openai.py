@@ -2,7 +2,6 @@ import typing
 from dataclasses import dataclass
 
 import openai
-import yaml
 
 from kgfiller import logger, unescape
 import kgfiller.ai as ai
@@ -69,7 +68,11 @@ class OpenAiQuery(ai.AiQuery):
         return openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError, openai.error.ServiceUnavailableError, openai.error.APIError
 
     def _chat_completion_to_dict(self, chat_completion) -> dict:
-        return yaml.safe_load(str(chat_completion))
+        return {
+            'model': chat_completion['model'],
+            'choices': [{'message': {'content': chat_completion['choices'][0]['message']['content']}}],
+            'usage': {'total_tokens': chat_completion['usage']['total_tokens']},
+        }
 
     def _extract_text_from_result(self, result) -> str:
         return unescape(result['choices'][0]['message']['content'])
@@ -0,0 +1,131 @@
+import email.utils
+import os
+import random
+import threading
+import time
+import typing
+
+from kgfiller import logger, replace_symbols_with
+from kgfiller.utils import get_env_var
+
+
+DEFAULT_BACKOFF_INITIAL = float(get_env_var("BACKOFF_INITIAL", "5", "initial backoff after rate limit errors, in seconds"))
+DEFAULT_BACKOFF_MAX = float(get_env_var("BACKOFF_MAX", "300", "max backoff after rate limit errors, in seconds"))
+DEFAULT_BACKOFF_FACTOR = 1.5
+
+
+class Backoff:
+    """Exponentially increasing delays, capped to `cap` seconds, each one randomly shortened by up to `jitter`
+    (as a fraction of the delay) so that concurrent callers do not retry all together."""
+
+    def __init__(self,
+                 initial: float = DEFAULT_BACKOFF_INITIAL,
+                 factor: float = DEFAULT_BACKOFF_FACTOR,
+                 cap: float = DEFAULT_BACKOFF_MAX,
+                 jitter: float = 0.5):
+        self._delay = initial
+        self._factor = factor
+        self._cap = cap
+        self._jitter = jitter
+
+    def next(self) -> float:
+        delay = min(self._delay, self._cap)
+        self._delay = delay * self._factor
+        return delay * (1 - random.uniform(0, self._jitter))
+
+
+class TokenBucket:
+    """Allows for `rate` units per minute on average, and bursts of up to `capacity` units."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self._rate = rate / 60
+        self._capacity = capacity or rate
+        self._available = self._capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """Takes `amount` units from the bucket, returning how many seconds to wait before they can be used."""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self._capacity, self._available + (now - self._last) * self._rate)
+            self._last = now
+            self._available -= min(amount, self._capacity)
+            return max(0.0, -self._available / self._rate)
+
+
+class RateLimiter:
+    """Limits the requests and tokens per minute sent to some API, and lets any caller pause all the others."""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0):
+        delay = 0.0
+        if self._requests is not None:
+            delay = max(delay, self._requests.reserve(1))
+        if self._tokens is not None and tokens > 0:
+            delay = max(delay, self._tokens.reserve(tokens))
+        while True:
+            with self._lock:
+                delay = max(delay, self._paused_until - time.monotonic())
+            if delay <= 0:
+                return
+            logger.debug("Rate limiting: waiting %.1f seconds", delay)
+            time.sleep(delay)
+            delay = 0.0
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _setting(name: str, api: str, model: str) -> float:
+    for suffix in [f"_{api}_{model}", f"_{api}", ""]:
+        variable = replace_symbols_with(name + suffix, "_").upper()
+        if os.environ.get(variable):
+            logger.debug("Loaded %s for API %s and model %s from environment variable %s", name, api, model, variable)
+            return float(os.environ[variable])
+    return 0
+
+
+_limiters: typing.Dict[typing.Tuple[str, str], RateLimiter] = dict()
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter(api: str, model: str) -> RateLimiter:
+    """The rate limiter shared by all queries to `model` via `api`.
+
+    Limits are read from the environment variables RPM and TPM (requests and tokens per minute), which may be
+    specialised by API and model, e.g. RPM_OPENAI or RPM_OPENAI_GPT_3_5_TURBO. Zero, the default, means no limit.
+    """
+    with _limiters_lock:
+        key = (api, model)
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(requests_per_minute=_setting("RPM", api, model),
+                                         tokens_per_minute=_setting("TPM", api, model))
+        return _limiters[key]
+
+
+def retry_after(error: Exception) -> float | None:
+    """The delay suggested by the backend via the Retry-After header of a failed response, if any."""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(error, "headers", None)
+        if headers is None:
+            headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers:
+            value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
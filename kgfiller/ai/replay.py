@@ -0,0 +1,156 @@
+import random
+import re
+import threading
+import time
+import typing
+from dataclasses import dataclass
+
+from lazy_property import LazyProperty
+
+from kgfiller import logger, unescape
+import kgfiller.ai as ai
+from kgfiller.text import str_hash
+from kgfiller.utils import get_env_var
+
+
+DEFAULT_MODEL = get_env_var("MODEL", "gpt-3.5-turbo", "Replayed model")
+DEFAULT_BACKGROUND = ai.DEFAULT_BACKGROUND
+
+RECORDED_APIS = {
+    "almaai": "OpenAiQuery",
+    "openai": "OpenAiQuery",
+    "hugging": "HuggingAiQuery",
+    "anthropic": "AnthropicAiQuery",
+}
+RECORDED_API = RECORDED_APIS[get_env_var("REPLAY_API", "openai", "Replayed API")]
+LATENCY = float(get_env_var("REPLAY_LATENCY", "0", "Latency of synthetic answers, in seconds"))
+ERROR_RATE = float(get_env_var("REPLAY_ERROR_RATE", "0", "Rate of injected rate limit errors"))
+RETRY_AFTER = get_env_var("REPLAY_RETRY_AFTER", "0.1", "Retry-After of injected errors, in seconds (empty for none)")
+
+FOODS = ["apple", "banana", "carrot", "tomato", "onion", "garlic", "potato", "rice", "bean", "lentil", "chickpea",
+         "cheese", "butter", "milk", "yogurt", "egg", "flour", "sugar", "salt", "pepper", "basil", "oregano", "parsley",
+         "thyme", "cinnamon", "ginger", "lemon", "lime", "orange", "cherry", "grape", "peach", "pear", "plum",
+         "mushroom", "spinach", "lettuce", "cabbage", "broccoli", "cauliflower", "zucchini", "eggplant", "pumpkin",
+         "walnut", "almond", "hazelnut", "chicken", "beef", "pork", "salmon", "tuna", "shrimp"]
+DISHES = ["lasagna", "risotto", "pizza", "omelette", "stew", "soup", "salad", "curry", "pie", "cake", "tart", "pudding",
+          "casserole", "sandwich", "burger", "pancake", "dumpling", "noodle", "sushi", "paella", "goulash", "chowder"]
+ADJECTIVES = ["fresh", "roasted", "smoked", "wild", "sweet", "spicy", "green", "red", "baked", "grilled"]
+
+
+class ReplayRateLimitError(Exception):
+    def __init__(self, retry_after: float | None):
+        super().__init__("Injected rate limit error")
+        self.retry_after = retry_after
+
+
+def _synthetic_item(rnd: random.Random, vocabulary: typing.List[str]) -> str:
+    name = rnd.choice(vocabulary)
+    if rnd.random() < 0.4:
+        name = f"{rnd.choice(ADJECTIVES)} {name}"
+    return name.capitalize()
+
+
+def synthetic_answer(question: str) -> str:
+    """A plausible answer to `question`, always the same for the same question."""
+    rnd = random.Random(str_hash(question))
+    lowered = question.lower()
+    if "yes or no" in lowered:
+        return "Yes." if rnd.random() < 0.2 else "No."
+    if "group of duplicates per line" in lowered:
+        options = re.findall(r"'([^']+)'", question)
+        if len(options) > 1 and rnd.random() < 0.3:
+            return " | ".join(rnd.sample(options, rnd.randint(2, min(3, len(options)))))
+        return "None."
+    if "among:" in lowered:
+        options = re.findall(r"'([^']+)'", question[lowered.index("among:"):])
+        if options:
+            return rnd.choice(options)
+    amount = re.search(r"\b(\d+)\b", question)
+    amount = min(int(amount.group(1)), 100) if amount else rnd.randint(3, 12)
+    vocabulary = DISHES if "famous" in lowered or "recipe" in lowered else FOODS
+    items = [_synthetic_item(rnd, vocabulary) for _ in range(amount)]
+    style = rnd.random()
+    if style < 0.5:
+        answer = "\n".join(f"{i + 1}. {item}" for i, item in enumerate(items))
+    elif style < 0.85:
+        answer = "\n".join(f"- {item}" for item in items)
+    else:
+        answer = ", ".join(item.lower() for item in items) + "."
+    if rnd.random() < 0.2:
+        answer = "Here are some examples:\n\n" + answer
+    return answer
+
+
+@dataclass
+class ReplayAiStats:
+    total_api_calls: int = 0
+    total_tokens: int = 0
+    injected_errors: int = 0
+
+    def plus(self, other: dict):
+        self.total_api_calls += 1
+        self.total_tokens += len(other['text'].split())
+
+    def print(self, prefix: str = None):
+        if prefix:
+            print(prefix, end='')
+        print("total API calls:", self.total_api_calls, "total tokens:", self.total_tokens,
+              "injected errors:", self.injected_errors, flush=True)
+
+
+stats = ReplayAiStats()
+
+_errors = random.Random(get_env_var("REPLAY_SEED", "0", "Seed for injected errors"))
+# guards both the injection of errors and the stats, as queries may be performed by worker threads
+_stats_lock = threading.Lock()
+
+
+class ReplayAiQuery(ai.AiQuery):
+    """Answers from the queries previously cached for `RECORDED_API`, or synthetic answers otherwise.
+
+    Synthetic answers are cached under this class's own query ids, hence they never mix with the recorded ones.
+    """
+
+    def __init__(self, **kwargs):
+        if "model" not in kwargs or kwargs["model"] is None:
+            kwargs["model"] = DEFAULT_MODEL
+        if "background" not in kwargs or kwargs["background"] is None:
+            kwargs["background"] = DEFAULT_BACKGROUND
+        super().__init__(**kwargs)
+
+    @LazyProperty
+    def cache_key(self) -> str:
+        recorded = str_hash(self._id(RECORDED_API))
+        return recorded if recorded in self.cache else str_hash(self.id)
+
+    def _chat_completion_step(self):
+        if LATENCY > 0:
+            time.sleep(LATENCY)
+        with _stats_lock:
+            fail = _errors.random() < ERROR_RATE
+            if fail:
+                stats.injected_errors += 1
+        if fail:
+            raise ReplayRateLimitError(float(RETRY_AFTER) if RETRY_AFTER else None)
+        result = {'text': synthetic_answer(self.question)}
+        logger.debug('synthetic answer to query "{}": {}'.format(self.question, result['text']))
+        with _stats_lock:
+            stats.plus(result)
+        return result
+
+    @classmethod
+    def _limit_error(cls) -> typing.Type[Exception]:
+        return ReplayRateLimitError
+
+    def _chat_completion_to_dict(self, chat_completion) -> dict:
+        return chat_completion
+
+    def _extract_text_from_result(self, result) -> str:
+        if 'choices' in result:
+            return unescape(result['choices'][0]['message']['content'])
+        elif 'completion' in result:
+            return unescape(result['completion'])
+        return unescape(result['text'])
+
+
+ai.DEFAULT_API = ReplayAiQuery
@@ -0,0 +1,141 @@
+import json
+import pathlib
+import typing
+
+import git
+
+from kgfiller import logger, PATH_DATA_DIR
+from kgfiller.utils import atomic_write, get_env_var
+
+
+PATH_CHECKPOINT = PATH_DATA_DIR / get_env_var("CHECKPOINT", "checkpoint.json",
+                                              "Checkpoint file, relative to the data directory")
+
+T = typing.TypeVar("T")
+
+
+class Checkpoint:
+    """Progress of the filling process, in terms of completed steps and of the last completed unit of work
+    (a class, an instance, ...) of the current step, so that an interrupted process can be resumed.
+
+    The cursor is a list of keys (e.g. a class name and an instance name), from outermost to innermost loop.
+    Units which may move or vanish while being processed (e.g. instances moved to other classes) cannot be resumed
+    from by position: the keys of the ones processed within the unit at the cursor are rather kept in `done`.
+    Without a `path`, progress is tracked in memory only.
+
+    Given the data `repo`, the checkpoint records its HEAD commit, and it is discarded when loaded onto a HEAD which
+    does not descend from that one, e.g. once the data repository was reset to an earlier commit.
+    """
+
+    def __init__(self, path: pathlib.Path | None = PATH_CHECKPOINT, repo: git.Repo | None = None):
+        self._path = path
+        self._repo = repo
+        self.completed: typing.List[str] = []
+        self.step: str | None = None
+        self.cursor: typing.List[str] = []
+        self.done: typing.List[str] = []
+        if path is not None and path.exists():
+            with open(path, "r") as file:
+                state = json.load(file)
+            if not self._describes_repo(state.get("head")):
+                logger.warning("Discarding checkpoint %s, which was recorded at commit %s, not an ancestor of HEAD",
+                               path, state.get("head"))
+                path.unlink()
+                return
+            self.completed = state.get("completed", [])
+            self.step = state.get("step")
+            self.cursor = state.get("cursor", [])
+            self.done = state.get("done", [])
+            logger.info("Resuming from checkpoint %s: completed steps %s, step %s at %s, done %s",
+                        path, self.completed, self.step, self.cursor, self.done)
+
+    def _head(self) -> str | None:
+        if self._repo is None or not self._repo.head.is_valid():
+            return None
+        return self._repo.head.commit.hexsha
+
+    def _describes_repo(self, head: str | None) -> bool:
+        if self._repo is None:
+            return True
+        if head is None or self._head() is None:
+            return False
+        try:
+            return self._repo.is_ancestor(head, self._head())
+        except git.exc.GitCommandError:
+            # e.g. the commit is unknown to this clone
+            return False
+
+    @property
+    def path(self) -> pathlib.Path | None:
+        return self._path
+
+    def is_completed(self, step: str) -> bool:
+        return step in self.completed
+
+    def pending(self,
+                step: str,
+                units: typing.Iterable[T],
+                key: typing.Callable[[T], str] = lambda unit: unit.name,
+                parents: typing.Sequence[str] = ()) -> typing.List[T]:
+        """The `units` of `step` yet to be processed, nested into the units whose keys are `parents`.
+
+        Units up to the cursor are skipped, except for the one the cursor is within, if any.
+        If the cursor is not among `units`, none is skipped. If the cursor is at `parents`, units marked as done
+        within them are skipped.
+        """
+        units = list(units)
+        depth = len(parents)
+        if self.step != step or self.cursor[:depth] != list(parents):
+            return units
+        if len(self.cursor) == depth:
+            return [unit for unit in units if key(unit) not in self.done]
+        keys = [key(unit) for unit in units]
+        if self.cursor[depth] not in keys:
+            logger.warning("Checkpoint %s of step %s not found: processing all units again", self.cursor, step)
+            return units
+        index = keys.index(self.cursor[depth])
+        within = len(self.cursor) > depth + 1 or len(self.done) > 0
+        return units[index:] if within else units[index + 1:]
+
+    def is_done(self, step: str, parents: typing.Sequence[str], *keys: str) -> bool:
+        """Whether all the units of `step` with `keys`, nested into the ones whose keys are `parents`, are done."""
+        return self.step == step and self.cursor == list(parents) and all(k in self.done for k in keys)
+
+    def advance(self, step: str, *cursor: str):
+        """Marks the unit of `step` identified by `cursor` as completed, to be persisted on next `save`."""
+        self.step = step
+        self.cursor = list(cursor)
+        self.done = []
+
+    def mark_done(self, step: str, parents: typing.Sequence[str], *keys: str):
+        """Marks the units of `step` with `keys`, nested into the ones whose keys are `parents`, as done, regardless
+        of their position, which may change as they are processed. This is persisted on next `save`."""
+        if self.step != step or self.cursor != list(parents):
+            self.step = step
+            self.cursor = list(parents)
+            self.done = []
+        self.done.extend(k for k in keys if k not in self.done)
+
+    def complete(self, step: str):
+        if step not in self.completed:
+            self.completed.append(step)
+        self.step = None
+        self.cursor = []
+        self.done = []
+        self.save()
+
+    def save(self):
+        if self._path is None:
+            return
+        with atomic_write(self._path) as file:
+            json.dump({"completed": self.completed, "step": self.step, "cursor": self.cursor, "done": self.done,
+                       "head": self._head()}, file)
+
+    def clear(self):
+        """Forgets all progress, e.g. once the filling process is over."""
+        self.completed = []
+        self.step = None
+        self.cursor = []
+        self.done = []
+        if self._path is not None:
+            self._path.unlink(missing_ok=True)
@@ -1,4 +1,5 @@
 import pathlib
+import time
 import typing
 
 import git
@@ -6,6 +7,15 @@ from gitdb.db.loose import LooseObjectDB
 
 from kgfiller import logger, PATH_DATA_DIR, Commitable
 from kgfiller.kg import PATH_ONTOLOGY
+from kgfiller.utils import get_env_var
+
+
+DEFAULT_COMMIT_EVERY = int(get_env_var("COMMIT_EVERY", "1", "Max amount of edits per commit"))
+DEFAULT_COMMIT_EVERY_SECONDS = float(get_env_var("COMMIT_EVERY_SECONDS", "0",
+                                                 "Max age of uncommitted edits, in seconds (0 for no limit)"))
+DEFAULT_COMMIT_VIA_INDEX = get_env_var("COMMIT_VIA_INDEX", "false",
+                                       "Whether to commit via GitPython's index rather than git commands").lower() \
+                           in {"1", "true", "yes"}
 
 
 class DataRepository(git.Repo):
@@ -16,12 +26,23 @@ class DataRepository(git.Repo):
                  path: typing.Any | None = None,
                  odbt: typing.Type[LooseObjectDB] = git.GitCmdObjectDB,
                  search_parent_directories: bool = False,
-                 expand_vars: bool = True) -> None:
+                 expand_vars: bool = True,
+                 commit_every: int = DEFAULT_COMMIT_EVERY,
+                 commit_every_seconds: float = DEFAULT_COMMIT_EVERY_SECONDS,
+                 commit_via_index: bool = DEFAULT_COMMIT_VIA_INDEX) -> None:
         if path is None:
             path = PATH_DATA_DIR
         git.Repo.__init__(self, path, odbt, search_parent_directories, expand_vars)
+        # edits are committed in batches of that many, or when the oldest one gets that old (0 for no limit)
+        self._commit_every = commit_every
+        self._commit_every_seconds = commit_every_seconds
+        self._commit_via_index = commit_via_index
+        self._pending: typing.List[Commitable] = []
+        self._pending_since = 0.0
+        self._before_commit: typing.Dict[typing.Callable[[], None], None] = dict()
+        self._index_was_reset = False
 
-    def commit_edits_if_any(self, message: str, file: str | pathlib.Path = None, description=None, *other_files):
+    def _relative_files(self, file: str | pathlib.Path = None, *other_files) -> typing.List[pathlib.Path]:
         if file is None:
             file = PATH_ONTOLOGY
         elif not isinstance(file, pathlib.Path):
@@ -33,10 +54,16 @@ class DataRepository(git.Repo):
                 raise FileNotFoundError(f"File {f} does not exist")
             else:
                 all_files[i] = f.relative_to(self.working_dir)
+        return all_files
+
+    def commit_edits_if_any(self, message: str, file: str | pathlib.Path = None, description=None, *other_files):
+        all_files = self._relative_files(file, *other_files)
         full_message = f"{message}\n\n{description}" if description else message
+        file_names = list(map(str, all_files))
+        if self._commit_via_index:
+            return self._commit_via_index_if_any(full_message, file_names)
         self.git.reset(".")
         self.git.add(*all_files)
-        file_names = list(map(str, all_files))
         try:
             self.git.commit("-m", full_message)
             logger.info("Committed changes to files %s, with message: `%s`", file_names, message)
@@ -49,10 +76,59 @@ class DataRepository(git.Repo):
             else:
                 raise e
 
-    def maybe_commit(self, commitable: Commitable):
-        if commitable.should_commit:
-            return self.commit_edits_if_any(commitable.message, commitable.files[0], commitable.description,
-                                            *commitable.files[1:])
-        else:
+    def _commit_via_index_if_any(self, full_message: str, file_names: typing.List[str]) -> bool:
+        if not self._index_was_reset:
+            # later on, the index only differs from HEAD by the files added here
+            self.git.reset(".")
+            self._index_was_reset = True
+        index = self.index
+        index.add(file_names)
+        if self.head.is_valid() and index.write_tree().binsha == self.head.commit.tree.binsha:
+            logger.info("Files %s didn't change: skipping commit", file_names)
+            return False
+        index.commit(full_message)
+        logger.info("Committed changes to files %s, with message: `%s`", file_names, full_message.split("\n")[0])
+        return True
+
+    def maybe_commit(self, commitable: Commitable, *before_commit: typing.Callable[[], None]):
+        """Commits `commitable`, or queues it to be committed along with the next ones, according to the batching
+        settings. Callbacks in `before_commit` are called, once, right before actually committing, e.g. to save
+        the files to commit."""
+        if not commitable.should_commit:
             logger.info("Nothing to commit")
             return False
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append(commitable)
+        for callback in before_commit:
+            self._before_commit[callback] = None
+        if len(self._pending) >= self._commit_every or \
+                (self._commit_every_seconds > 0 and time.monotonic() - self._pending_since >= self._commit_every_seconds):
+            return self.flush()
+        return True
+
+    def flush(self) -> bool:
+        """Commits all queued edits at once, if any."""
+        if not self._pending:
+            return False
+        pending, self._pending = self._pending, []
+        before_commit, self._before_commit = self._before_commit, dict()
+        for callback in before_commit:
+            callback()
+        files = list(dict.fromkeys(file for commitable in pending for file in commitable.files))
+        if len(pending) == 1:
+            message, description = pending[0].message, pending[0].description
+        else:
+            message = f"{pending[0].message} (and {len(pending) - 1} more edits)"
+            description = "\n\n".join(f"[{i}/{len(pending)}] {c.message}\n{c.description or ''}".strip()
+                                      for i, c in enumerate(pending, start=1))
+        return self.commit_edits_if_any(message, files[0], description, *files[1:])
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.flush()
+        elif self._pending:
+            # the callbacks writing the files to commit may fail in turn, e.g. if the ontology's world was closed,
+            # hiding the original error: edits are left on disk for the next commit instead
+            logger.warning("Not committing %d pending edits because of %s", len(self._pending), exc_type.__name__)
+        super().__exit__(exc_type, exc_value, traceback)
@@ -0,0 +1,101 @@
+import argparse
+import json
+import pathlib
+import typing
+
+from kgfiller import logger
+from kgfiller.utils import atomic_write, get_env_var
+
+
+DEFAULT_JOURNAL_FILE = get_env_var("JOURNAL", "journal.jsonl",
+                                   "Journal of edits to the ontology, next to it (empty for none)")
+DEFAULT_JOURNAL_MAX_SIZE = int(get_env_var("JOURNAL_MAX_SIZE", str(64 * 1024 * 1024),
+                                           "Size of the journal triggering its compaction upon save, in bytes "
+                                           "(0 for never)"))
+
+SAVED = "save"
+
+
+class Journal:
+    """Append-only JSONL log of the edits to an ontology, one JSON object per line, with an `op` field.
+
+    Saving the ontology is logged too, hence the ontology file is a snapshot of the edits up to the last save:
+    compaction drops them from the journal, and the edits after the last save can be replayed onto the snapshot.
+    """
+
+    def __init__(self, path: pathlib.Path, max_size: int = DEFAULT_JOURNAL_MAX_SIZE):
+        self._path = path
+        self._max_size = max_size
+        self._file = None
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    def append(self, op: str, **fields):
+        if self._file is None:
+            self._file = open(self._path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"op": op, **fields}, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def saved(self):
+        """Logs that the ontology was saved, compacting the journal if it got too large."""
+        self.append(SAVED)
+        if 0 < self._max_size <= self._path.stat().st_size:
+            self.compact()
+
+    def records(self, since_last_save: bool = False) -> typing.List[dict]:
+        records = []
+        if not self._path.exists():
+            return records
+        with open(self._path, "r", encoding="utf-8") as file:
+            for number, line in enumerate(file, start=1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be truncated, if the process was killed while writing it
+                    logger.warning("Ignoring malformed line %d of journal %s", number, self._path)
+                    continue
+                if since_last_save and record["op"] == SAVED:
+                    records.clear()
+                else:
+                    records.append(record)
+        return records
+
+    def compact(self):
+        """Drops the edits up to the last save, which the ontology file already reflects."""
+        records = self.records(since_last_save=True)
+        self.close()
+        with atomic_write(self._path, encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        logger.debug("Compacted journal %s down to %d records", self._path, len(records))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m kgfiller.journal",
+                                     description="Recover or compact the journal of edits to the ontology")
+    parser.add_argument("command", choices=["replay", "compact"],
+                        help="replay: apply the edits after the last save to the ontology, and save it; "
+                             "compact: drop the edits up to the last save from the journal")
+    parser.add_argument("--ontology", type=pathlib.Path, default=None, help="path of the ontology")
+    args = parser.parse_args()
+    from kgfiller.kg import KnowledgeGraph, PATH_ONTOLOGY
+    ontology = args.ontology or PATH_ONTOLOGY
+    journal = Journal(ontology.with_name(DEFAULT_JOURNAL_FILE))
+    if args.command == "replay":
+        # the edits after the last save are the ones missing from the ontology file, rather than from the quadstore
+        kg = KnowledgeGraph(ontology, journal_file="", quadstore_file="")
+        count = kg.replay(journal.records(since_last_save=True))
+        kg.save(force=True)
+        journal.saved()
+        journal.close()
+        print(f"replayed {count} edits onto {ontology}")
+    else:
+        journal.compact()
+        print(f"compacted {journal.path}")
@@ -1,17 +1,62 @@
+import contextlib
+import functools
 import pathlib
+import time
+from dataclasses import dataclass
 
 import owlready2 as owlready
 import unidecode
 from lazy_property import LazyProperty
 
 from kgfiller import PATH_DATA_DIR, replace_symbols_with, logger
+from kgfiller.journal import DEFAULT_JOURNAL_FILE, Journal
 from kgfiller.utils import *
 
 PATH_ONTOLOGY = PATH_DATA_DIR / "ontology.owl"
-logger.debug("ONTOLOGY_PATH = %s", PATH_ONTOLOGY.absolute())
 
-if not PATH_ONTOLOGY.exists():
-    raise FileNotFoundError(f"ONTOLOGY_PATH {PATH_ONTOLOGY.absolute()} does not exist")
+DEFAULT_SAVE_EVERY_MUTATIONS = int(get_env_var("SAVE_EVERY_MUTATIONS", "0",
+                                               "Max amount of unsaved edits to the ontology (0 for no limit)"))
+DEFAULT_SAVE_EVERY_SECONDS = float(get_env_var("SAVE_EVERY_SECONDS", "0",
+                                               "Max age of unsaved edits to the ontology, in seconds (0 for no limit)"))
+SAVE_FORMATS = ("rdfxml", "ntriples")
+DEFAULT_SAVE_FORMAT = get_env_var("SAVE_FORMAT", "rdfxml",
+                                  f"Format of the saved ontology, among {', '.join(SAVE_FORMATS)}")
+SAVE_BUFFER_SIZE = 1 << 20
+DEFAULT_QUADSTORE_FILE = get_env_var("QUADSTORE", "",
+                                     "SQLite quadstore persisting the ontology, next to it (empty for none)")
+
+
+class ClassHierarchy:
+    """Subsumption among some `classes`, as bitsets of descendants, answering None for classes it does not know."""
+
+    def __init__(self, classes: typing.Iterable[owlready.ThingClass]):
+        classes = [owlready.Thing] + [cls for cls in classes if cls is not owlready.Thing]
+        self._bits = {cls: 1 << i for i, cls in enumerate(classes)}
+        self._descendants = {owlready.Thing: (1 << len(classes)) - 1}
+        for cls in classes[1:]:
+            self._descendants[cls] = sum(self._bits.get(d, 0) for d in cls.descendants())
+
+    def subtype(self, cls1: owlready.ThingClass, cls2: owlready.ThingClass, strict: bool = False) -> bool | None:
+        if cls1 not in self._bits or cls2 not in self._bits:
+            return None
+        if strict and cls1 is cls2:
+            return False
+        return bool(self._bits[cls1] & self._descendants[cls2])
+
+    def is_leaf(self, cls: owlready.ThingClass) -> bool | None:
+        if cls not in self._bits:
+            return None
+        return self._descendants[cls] == self._bits[cls]
+
+    def instance_of(self, instance: owlready.Thing, cls: owlready.ThingClass) -> bool | None:
+        if cls not in self._bits:
+            return None
+        types = 0
+        for t in _types(instance):
+            if t not in self._bits:
+                return None
+            types |= self._bits[t]
+        return bool(types & self._descendants[cls])
 
 
 def is_leaf(cls: owlready.ThingClass) -> bool:
@@ -30,6 +75,10 @@ def instance_of(instance: owlready.Thing, cls: owlready.ThingClass) -> bool:
     return overlap(instance.is_a, cls.descendants())
 
 
+def _types(instance: owlready.Thing) -> typing.List[owlready.ThingClass]:
+    return [t for t in instance.is_a if isinstance(t, owlready.ThingClass)]
+
+
 def human_name(cls_or_instance: owlready.ThingClass | owlready.Thing) -> str:
     return first_or_none(cls_or_instance.fancyName) or cls_or_instance.name
 
@@ -44,10 +93,141 @@ def owl_name(name: str, instance: bool = True) -> str:
     return name
 
 
+def _escape(literal: typing.Any) -> typing.Any:
+    if isinstance(literal, str):
+        return literal.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return literal
+
+
+def _write_ntriples(onto: owlready.Ontology, file: typing.BinaryIO, lines_per_write: int = 10000) -> None:
+    # same output as owlready's own N-Triples writer, which queries the IRI of each resource apart and writes each
+    # triple apart, but way faster: IRIs are fetched all at once, and lines are written in chunks
+    graph = onto.graph
+    if graph._get_data_triples_d_o(owlready.rdfs_proposition):
+        # reified triples, which owlready writes in its own way
+        onto.save(file, format="ntriples")
+        return
+    iris = onto.world.graph.get_storid_dict()
+
+    def resource(storid: int) -> str:
+        return f"_:{-storid}" if storid < 0 else f"<{iris[storid]}>"
+
+    lines = []
+    for s, p, o, d in graph._iter_triples():
+        if d is None:
+            o = resource(o)
+        elif isinstance(d, str) and d.startswith("@"):
+            o = f'"{_escape(o)}"{d}'
+        elif d == 0:
+            o = f'"{_escape(o)}"'
+        else:
+            o = f'"{_escape(o)}"^^<{iris[d]}>'
+        lines.append(f"{resource(s)} <{iris[p]}> {o} .\n")
+        if len(lines) >= lines_per_write:
+            file.write("".join(lines).encode("utf8"))
+            lines.clear()
+    file.write("".join(lines).encode("utf8"))
+
+
+def save_ontology(onto: owlready.Ontology, path: pathlib.Path, format: str = DEFAULT_SAVE_FORMAT) -> None:
+    """Writes `onto` into `path` in the given `format`, streaming triples into a temporary file which then replaces
+    `path` atomically."""
+    if format not in SAVE_FORMATS:
+        raise ValueError(f"Unsupported ontology format {format}, not among {', '.join(SAVE_FORMATS)}")
+    with atomic_write(path, "wb", buffering=SAVE_BUFFER_SIZE) as file:
+        if format == "ntriples":
+            _write_ntriples(onto, file)
+        else:
+            onto.save(file, format=format)
+
+
+def _encode(value: owlready.ThingClass | owlready.Thing | typing.Any) -> typing.Any:
+    if isinstance(value, owlready.ThingClass):
+        return {"class": value.name}
+    if isinstance(value, owlready.Thing):
+        return {"individual": value.name}
+    return value
+
+
+def _journaled(fields: typing.Callable[..., dict]):
+    """Logs calls to the decorated method of KnowledgeGraph into its journal, described by `fields`, which is
+    called with the same arguments as the method before it runs. Calls nested into other logged ones are not logged."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self: "KnowledgeGraph", *args, **kwargs):
+            if self._journal is None or self._journaling:
+                return method(self, *args, **kwargs)
+            record = fields(*args, **kwargs)
+            if self._origin is not None:
+                record["query"] = self._origin
+            self._journaling = True
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                self._journaling = False
+            self._journal.append(method.__name__, **record)
+            return result
+        return wrapper
+    return decorator
+
+
+def _depth_first(root: owlready.ThingClass, postorder: bool = True) -> typing.List[owlready.ThingClass]:
+    """Classes reachable from `root` via subclasses, depth first, in pre- or post-order: classes with several
+    parents are met once per parent."""
+    order = []
+    stack = [(root, False)]
+    while stack:
+        cls, visited = stack.pop()
+        if visited:
+            order.append(cls)
+            continue
+        if postorder:
+            stack.append((cls, True))
+        else:
+            order.append(cls)
+        stack.extend((child, False) for child in reversed(list(cls.subclasses())))
+    return order
+
+
+@dataclass
+class AddedInstance:
+    name: str
+    instance: owlready.Thing
+    created: bool
+
+
 class KnowledgeGraph:
-    def __init__(self, path: pathlib.Path = PATH_ONTOLOGY) -> None:
+    def __init__(self,
+                 path: pathlib.Path = PATH_ONTOLOGY,
+                 save_every_mutations: int = DEFAULT_SAVE_EVERY_MUTATIONS,
+                 save_every_seconds: float = DEFAULT_SAVE_EVERY_SECONDS,
+                 journal_file: str = DEFAULT_JOURNAL_FILE,
+                 quadstore_file: str = DEFAULT_QUADSTORE_FILE,
+                 save_format: str = DEFAULT_SAVE_FORMAT) -> None:
+        if save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unsupported ontology format {save_format}, not among {', '.join(SAVE_FORMATS)}")
         self._path = path
         self._uri = path.as_uri()
+        self._save_format = save_format
+        # if any, the ontology is persisted incrementally into this quadstore, next to it, and the ontology file is
+        # only rewritten (exported) on demand
+        self._quadstore = path.with_name(quadstore_file) if quadstore_file else None
+        self._unexported = 0
+        # edits are logged into this file, next to the ontology, unless it is empty
+        self._journal = Journal(path.with_name(journal_file)) if journal_file else None
+        self._journaling = False
+        self._origin = None
+        # besides explicit calls to save, the ontology is saved as soon as it undergoes that many edits,
+        # or when it is edited that many seconds after the last save (0 for never)
+        self._save_every_mutations = save_every_mutations
+        self._save_every_seconds = save_every_seconds
+        self._mutations = 0
+        self._last_save = time.monotonic()
+        # (individual or class, property name) -> values, to check for existing values in constant time
+        self._property_values: typing.Dict[typing.Tuple[typing.Any, str], set] = dict()
+        self._inverse_properties: typing.Dict[str, str | None] = dict()
+        # (root, postorder) -> classes in depth-first order
+        self._class_orders: typing.Dict[typing.Tuple[owlready.ThingClass, bool], typing.List[owlready.ThingClass]] = dict()
 
     @property
     def path(self) -> pathlib.Path:
@@ -55,9 +235,102 @@ class KnowledgeGraph:
 
     @LazyProperty
     def onto(self) -> owlready.Ontology:
+        if not self._path.exists():
+            raise FileNotFoundError(f"ONTOLOGY_PATH {self._path.absolute()} does not exist")
+        if self._quadstore is not None:
+            return self._load_quadstore()
         logger.debug("Loading ontology from %s", self._uri)
         return owlready.get_ontology(self._uri).load()
 
+    def _source_stamp(self) -> str:
+        stat = self._path.stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _load_quadstore(self) -> owlready.Ontology:
+        world = owlready.World(filename=str(self._quadstore))
+        world.graph.execute("CREATE TABLE IF NOT EXISTS kgfiller (key TEXT PRIMARY KEY, value TEXT)")
+        stored = dict(world.graph.execute("SELECT key, value FROM kgfiller"))
+        if stored.get("source") == self._source_stamp() and stored.get("iri") in world.ontologies:
+            logger.debug("Loading ontology from quadstore %s", self._quadstore)
+            return world.ontologies[stored["iri"]]
+        # the quadstore is new, or the ontology file changed since it was last exported: rebuild the former
+        logger.debug("Loading ontology from %s into quadstore %s", self._uri, self._quadstore)
+        world.close()
+        self._quadstore.unlink(missing_ok=True)
+        world = owlready.World(filename=str(self._quadstore))
+        world.graph.execute("CREATE TABLE kgfiller (key TEXT PRIMARY KEY, value TEXT)")
+        onto = world.get_ontology(self._uri).load()
+        self._stamp_quadstore(onto)
+        world.save()
+        return onto
+
+    def _stamp_quadstore(self, onto: owlready.Ontology):
+        # the ontology file the quadstore is in sync with, as committed along with the next save
+        onto.world.graph.execute("INSERT OR REPLACE INTO kgfiller VALUES (?, ?), (?, ?)",
+                                 ("source", self._source_stamp(), "iri", onto.base_iri))
+
+    @LazyProperty
+    def _direct_instances(self) -> typing.Dict[owlready.ThingClass, typing.Dict[owlready.Thing, None]]:
+        # class -> instances having it among their own types, kept in insertion order
+        index = dict()
+        for instance in self.onto.individuals():
+            self._index_instance(instance, _types(instance), index)
+        return index
+
+    @LazyProperty
+    def _individuals(self) -> typing.Dict[str, owlready.Thing]:
+        return {instance.name: instance for instance in self.onto.individuals()}
+
+    def _index_instance(self, instance: owlready.Thing, types: typing.Iterable[owlready.ThingClass], index=None):
+        index = self._direct_instances if index is None else index
+        for cls in types:
+            index.setdefault(cls, dict())[instance] = None
+
+    def _unindex_instance(self, instance: owlready.Thing, types: typing.Iterable[owlready.ThingClass]):
+        for cls in types:
+            self._direct_instances.get(cls, dict()).pop(instance, None)
+
+    def direct_instances(self, cls: str | owlready.ThingClass) -> typing.List[owlready.Thing]:
+        """Instances of `cls` which are not instances of any of its subclasses."""
+        cls = self.onto[cls] if isinstance(cls, str) else cls
+        candidates = self._direct_instances.get(cls, dict())
+        if not candidates:
+            return []
+        return [i for i in candidates if not any(self.subtype(t, cls, strict=True) for t in _types(i))]
+
+    @LazyProperty
+    def hierarchy(self) -> ClassHierarchy:
+        """Subsumption among the classes of the ontology, as of the last call to `classes_changed`."""
+        return ClassHierarchy(self.onto.classes())
+
+    def classes_changed(self) -> None:
+        """Forgets the class hierarchy, root class and traversal orders: to be called after adding or moving classes."""
+        if hasattr(self, "_hierarchy"):
+            del self._hierarchy
+        if hasattr(self, "_root_class"):
+            del self._root_class
+        self._class_orders.clear()
+
+    def is_leaf(self, cls: owlready.ThingClass) -> bool:
+        answer = self.hierarchy.is_leaf(cls)
+        return is_leaf(cls) if answer is None else answer
+
+    def subtype(self, cls1: owlready.ThingClass, cls2: owlready.ThingClass, strict: bool = False) -> bool:
+        answer = self.hierarchy.subtype(cls1, cls2, strict)
+        return subtype(cls1, cls2, strict) if answer is None else answer
+
+    def supertype(self, cls1: owlready.ThingClass, cls2: owlready.ThingClass, strict: bool = False) -> bool:
+        answer = self.hierarchy.subtype(cls2, cls1, strict)
+        return supertype(cls1, cls2, strict) if answer is None else answer
+
+    def instance_of(self, instance: owlready.Thing, cls: owlready.ThingClass) -> bool:
+        answer = self.hierarchy.instance_of(instance, cls)
+        return instance_of(instance, cls) if answer is None else answer
+
+    @LazyProperty
+    def root_class(self) -> owlready.ThingClass:
+        return self._find_root_class()
+
     def _find_root_class(self):
         things = set()
         for cls in self.onto.classes():
@@ -68,20 +341,57 @@ class KnowledgeGraph:
         else:
             return owlready.Thing
 
+    def _values_of(self, cls_or_instance: owlready.ThingClass | owlready.Thing, property: str) -> set:
+        key = (cls_or_instance, property)
+        if key not in self._property_values:
+            self._property_values[key] = set(getattr(cls_or_instance, property))
+        return self._property_values[key]
+
+    def _inverse_of(self, property: str) -> str | None:
+        if property not in self._inverse_properties:
+            inverse = getattr(self.onto[property], "inverse_property", None)
+            self._inverse_properties[property] = inverse.name if inverse is not None else None
+        return self._inverse_properties[property]
+
+    @_journaled(lambda cls_or_instance, property, value: dict(subject=_encode(cls_or_instance),
+                                                              property=getattr(property, "name", property),
+                                                              value=_encode(value)))
     def add_property(self, cls_or_instance: owlready.ThingClass | owlready.Thing,
                      property: str | owlready.ObjectPropertyClass,
                      value: owlready.ThingClass | owlready.Thing | str) -> None:
         if isinstance(property, owlready.ObjectPropertyClass):
             property = property.name
-        property_values = getattr(cls_or_instance, property)
+        property_values = self._values_of(cls_or_instance, property)
         if value not in property_values:
-            property_values.append(value)
+            getattr(cls_or_instance, property).append(value)
+            property_values.add(value)
+            if isinstance(cls_or_instance, owlready.ThingClass):
+                # e.g. is_a, moving the class elsewhere in the hierarchy
+                self.classes_changed()
+            self._mutated()
+            inverse = self._inverse_of(property) if isinstance(value, owlready.Thing) else None
+            if inverse is not None and (value, inverse) in self._property_values:
+                self._property_values[(value, inverse)].add(cls_or_instance)
         logger.debug("Set property '%s' of %s to %s", property, cls_or_instance, value)
 
+    @_journaled(lambda name, parents: dict(name=name, parents=[_encode(p) for p in parents]))
+    def add_class(self, name: str, parents: typing.Sequence[owlready.ThingClass]) -> owlready.ThingClass:
+        """Ensures there is a class named `name` in the ontology, subclass of `parents` if created."""
+        cls = self.onto[name]
+        if cls is None:
+            with self.onto:
+                cls = owlready.types.new_class(name, tuple(parents))
+            self.classes_changed()
+            self._mutated()
+            logger.debug("Created class %s, subclass of %s", cls, list(parents))
+        return cls
+
+    @_journaled(lambda instance, cls: dict(instance=instance.name, **{"class": getattr(cls, "name", cls)}))
     def set_class_of_instance(self, instance: owlready.Thing, cls: str | owlready.ThingClass) -> owlready.Thing:
         initial = set(instance.is_instance_of)
-        too_generic_types = [c for c in instance.is_instance_of if supertype(c, cls, strict=True)]
-        too_specific_types = [c for c in instance.is_instance_of if subtype(c, cls, strict=False)]
+        initial_types = _types(instance)
+        too_generic_types = [c for c in instance.is_instance_of if self.supertype(c, cls, strict=True)]
+        too_specific_types = [c for c in instance.is_instance_of if self.subtype(c, cls, strict=False)]
         if len(too_generic_types) > 0:
             for type in too_generic_types:
                 instance.is_instance_of.remove(type)
@@ -90,6 +400,11 @@ class KnowledgeGraph:
         if len(instance.is_instance_of) > 1 and owlready.ThingClass in instance.is_instance_of:
             instance.is_instance_of.remove(owlready.Thing)
         final = set(instance.is_instance_of)
+        final_types = _types(instance)
+        self._unindex_instance(instance, [t for t in initial_types if t not in final_types])
+        self._index_instance(instance, [t for t in final_types if t not in initial_types])
+        if set(initial_types) != set(final_types):
+            self._mutated()
         for snapshot in [initial, final]:
             if owlready.Thing in snapshot:
                 snapshot.remove(owlready.Thing)
@@ -102,28 +417,60 @@ class KnowledgeGraph:
 
     def add_instance(self, cls: str | owlready.ThingClass, name: str,
                      add_to_class_if_existing: bool = True) -> owlready.Thing:
-        fancy_name = name
-        name = owl_name(name)
+        return self.add_instances(cls, [name], add_to_class_if_existing)[0].instance
+
+    @_journaled(lambda cls, names, add_to_class_if_existing=True: dict(names=list(names),
+                                                                      add_to_class_if_existing=add_to_class_if_existing,
+                                                                      **{"class": getattr(cls, "name", cls)}))
+    def add_instances(self, cls: str | owlready.ThingClass, names: typing.Sequence[str],
+                      add_to_class_if_existing: bool = True) -> typing.List["AddedInstance"]:
+        """Ensures there is an instance of `cls` for each name in `names`, reporting about each name in order."""
         cls = self.onto[cls] if isinstance(cls, str) else cls
-        instance = first_or_none(filter(lambda i: i.name == name, cls.instances()))
-        if instance is not None:
-            if add_to_class_if_existing:
+        names = [(owl_name(fancy_name), fancy_name) for fancy_name in names]
+        fancy_names_by_name: typing.Dict[str, typing.List[str]] = dict()
+        for name, fancy_name in names:
+            fancy_names_by_name.setdefault(name, []).append(fancy_name)
+        instances = dict()
+        created = set()
+        for name, fancy_names in fancy_names_by_name.items():
+            instance = self._individuals.get(name)
+            if instance is not None and isinstance(instance, cls):
+                if not add_to_class_if_existing:
+                    raise KeyError(f"Instance {name} already exists in classes {instance.is_instance_of}")
                 self.set_class_of_instance(instance, cls)
+            elif len(fancy_names) > 1 and not add_to_class_if_existing:
+                raise KeyError(f"Instance {name} would be added {len(fancy_names)} times")
             else:
-                raise KeyError(f"Instance {name} already exists in classes {instance.is_instance_of}")
-        else:
-            instance = cls(name)
-            logger.debug("Created instance %s of class %s", instance, cls)
-        if self.onto.fancyName is not None and name != fancy_name:
-            self.add_property(instance, "fancyName", fancy_name)
-        return instance
-    
+                # an individual named so may already exist in other classes, to which cls is added
+                if instance is None:
+                    created.add(name)
+                instance = cls(name)
+                self._individuals[name] = instance
+                self._index_instance(instance, _types(instance))
+                self._mutated()
+            instances[name] = instance
+            if self.onto.fancyName is not None:
+                for fancy_name in dict.fromkeys(fancy_names):
+                    if fancy_name != name:
+                        self.add_property(instance, "fancyName", fancy_name)
+        logger.debug("Created %d instances of class %s: %s", len(created), cls, sorted(created))
+        report = []
+        for name, fancy_name in names:
+            report.append(AddedInstance(fancy_name, instances[name], name in created))
+            created.discard(name)
+        return report
+
+    def alive(self, instance: owlready.Thing, cls: owlready.ThingClass) -> bool:
+        """Whether `instance` is still an instance of `cls`, i.e. it was neither destroyed nor moved elsewhere."""
+        return self._individuals.get(instance.name) is instance and self.instance_of(instance, cls)
+
+    @_journaled(lambda instance1, instance2, cls: dict(instance1=instance1.name, instance2=instance2.name,
+                                                       **{"class": cls.name}))
     def merge_instances(self, instance1: owlready.Thing, instance2: owlready.Thing, cls: owlready.ThingClass) -> bool:
-        all_instances = [inst for inst in cls.instances()]
-        if not (instance1 in all_instances):
+        if not self.alive(instance1, cls):
             logger.debug('Instance "{}" has been already removed previously...'.format(instance1))
             return False
-        if not (instance2 in all_instances):
+        if not self.alive(instance2, cls):
             logger.debug('Instance "{}" has been already removed previously...'.format(instance2))
             return False
         logger.debug("Merging instances '{}' and '{}'".format(instance1, instance2))
@@ -135,27 +482,141 @@ class KnowledgeGraph:
                                  "into instance '{}' with value '{}'".format(prop.name, instance2, 
                                                                          instance1, value))
                     self.add_property(instance1, prop.name, value)
-        logger.debug("Destroying instance '{}'".format(instance2))
-        owlready.destroy_entity(instance2)
+        self.destroy_instance(instance2)
         return True
 
+    @_journaled(lambda instance: dict(instance=instance.name))
+    def destroy_instance(self, instance: owlready.Thing) -> None:
+        logger.debug("Destroying instance '{}'".format(instance))
+        self._unindex_instance(instance, _types(instance))
+        self._individuals.pop(instance.name, None)
+        # destroying an individual also removes it from the properties of others
+        for key in [key for key in self._property_values if key[0] is instance]:
+            del self._property_values[key]
+        for values in self._property_values.values():
+            values.discard(instance)
+        owlready.destroy_entity(instance)
+        self._mutated()
+
     def visit_classes_depth_first(self, root: str | owlready.ThingClass | None = None, postorder=True) -> \
             typing.Iterable[owlready.ThingClass]:
-        root = self._find_root_class() if root is None else root
+        root = self.root_class if root is None else root
         root = self.onto[root] if isinstance(root, str) else root
-        if not postorder:
-            yield root
-        for child in root.subclasses():
-            yield from self.visit_classes_depth_first(child, postorder)
-        if postorder:
-            yield root
+        key = (root, postorder)
+        if key not in self._class_orders:
+            self._class_orders[key] = _depth_first(root, postorder)
+        return iter(self._class_orders[key])
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the ontology was edited since it was last saved."""
+        return self._mutations > 0
+
+    def _mutated(self):
+        self._mutations += 1
+        self._unexported += 1
+        if self._save_every_mutations > 0 and self._mutations >= self._save_every_mutations:
+            self.save(export=False)
+        elif self._save_every_seconds > 0 and time.monotonic() - self._last_save >= self._save_every_seconds:
+            self.save(export=False)
+
+    def _export(self):
+        save_ontology(self.onto, self._path, self._save_format)
+        logger.debug("Saved %d edits to the ontology into %s", self._unexported, self._path)
+        self._unexported = 0
+
+    def save(self, force: bool = False, export: bool = True) -> None:
+        """Saves the ontology, if edited since it was last saved or `force`d to.
+
+        Without a quadstore, this replaces the ontology file atomically. Otherwise, edits are committed to the
+        quadstore, and the ontology file is rewritten only if `export`, e.g. before committing it.
+        """
+        if self._quadstore is None:
+            if not self.dirty and not force:
+                return
+            self._export()
+            exporting = True
+        else:
+            exporting = export and (self._unexported > 0 or force)
+            if not self.dirty and not exporting and not force:
+                return
+            if exporting:
+                self._export()
+                self._stamp_quadstore(self.onto)
+            self.onto.world.save()
+            logger.debug("Saved %d edits to the ontology into quadstore %s", self._mutations, self._quadstore)
+        self._mutations = 0
+        self._last_save = time.monotonic()
+        # edits journaled since the ontology file was last written are the ones to replay onto it
+        if self._journal is not None and exporting:
+            self._journal.saved()
+
+    def save_edits(self) -> None:
+        """Saves the ontology without exporting it, e.g. before each commit: with a quadstore, edits only reach the
+        ontology file upon `save()`, e.g. at the end of each step."""
+        self.save(export=False)
+
+    @contextlib.contextmanager
+    def origin(self, query_id: str):
+        """Marks the edits made within this context, in the journal, as caused by the query with id `query_id`."""
+        previous, self._origin = self._origin, query_id
+        try:
+            yield
+        finally:
+            self._origin = previous
+
+    def _decode(self, value: typing.Any) -> typing.Any:
+        if isinstance(value, dict) and "class" in value:
+            return owlready.Thing if value["class"] == owlready.Thing.name else self.onto[value["class"]]
+        if isinstance(value, dict) and "individual" in value:
+            return self._individuals.get(value["individual"])
+        return value
 
-    def save(self) -> None:
-        self.onto.save(str(self._path))
+    def replay(self, records: typing.Iterable[dict]) -> int:
+        """Applies journaled edits, e.g. the ones after the ontology was last saved, returning how many."""
+        journal, self._journal = self._journal, None
+        count = 0
+        try:
+            for record in records:
+                op = record["op"]
+                if op == "add_class":
+                    self.add_class(record["name"], [self._decode(p) for p in record["parents"]])
+                elif op == "add_instances":
+                    self.add_instances(self.onto[record["class"]], record["names"], record["add_to_class_if_existing"])
+                elif op == "add_property":
+                    subject = self._decode(record["subject"])
+                    value = self._decode(record["value"])
+                    if subject is None or value is None:
+                        logger.warning("Cannot replay edit %s: missing individual", record)
+                        continue
+                    self.add_property(subject, record["property"], value)
+                elif op in {"set_class_of_instance", "merge_instances", "destroy_instance"}:
+                    names = [record[k] for k in ["instance", "instance1", "instance2"] if k in record]
+                    instances = [self._individuals.get(name) for name in names]
+                    if None in instances:
+                        logger.warning("Cannot replay edit %s: missing individual", record)
+                        continue
+                    if op == "set_class_of_instance":
+                        self.set_class_of_instance(instances[0], self.onto[record["class"]])
+                    elif op == "merge_instances":
+                        self.merge_instances(instances[0], instances[1], self.onto[record["class"]])
+                    else:
+                        self.destroy_instance(instances[0])
+                else:
+                    continue
+                count += 1
+        finally:
+            self._journal = journal
+        return count
 
     def __enter__(self) -> "KnowledgeGraph":
         self.onto
+        self.hierarchy
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
         self.save()
+        if self._journal is not None:
+            self._journal.close()
+        if self._quadstore is not None:
+            self.onto.world.close()
@@ -0,0 +1,150 @@
+import argparse
+import functools
+import mmap
+import os
+import pathlib
+import threading
+import typing
+import zipfile
+
+from kgfiller import logger
+from kgfiller.utils import PATH_REPO, atomic_write, get_env_var
+
+
+PATH_LEMMAS = pathlib.Path(get_env_var("LEMMAS", str(PATH_REPO / "lemmas.txt"),
+                                       "Sorted file of the words WordNet has synsets for"))
+DEFAULT_LEMMAS_CACHE_SIZE = int(get_env_var("LEMMAS_CACHE_SIZE", "65536",
+                                            "Amount of words whose lookup into the lemmas file is cached"))
+
+# WordNet's parts of speech, with the suffixes of their index and exception files
+POS_FILES = {"n": "noun", "v": "verb", "a": "adj", "r": "adv"}
+
+# as in nltk's WordNetCorpusReader, which applies them once to words lacking exceptions
+MORPHOLOGICAL_SUBSTITUTIONS = {
+    "n": [("s", ""), ("ses", "s"), ("ves", "f"), ("xes", "x"), ("zes", "z"), ("ches", "ch"), ("shes", "sh"),
+          ("men", "man"), ("ies", "y")],
+    "v": [("s", ""), ("ies", "y"), ("es", "e"), ("es", ""), ("ed", "e"), ("ed", ""), ("ing", "e"), ("ing", "")],
+    "a": [("er", ""), ("est", ""), ("er", "e"), ("est", "e")],
+    "r": [],
+}
+
+
+def _wordnet_files(wordnet: pathlib.Path) -> typing.Callable[[str], typing.Iterable[str]]:
+    if zipfile.is_zipfile(wordnet):
+        archive = zipfile.ZipFile(wordnet)
+        return lambda name: archive.read(f"wordnet/{name}").decode("utf-8").splitlines()
+    return lambda name: (wordnet / name).read_text(encoding="utf-8").splitlines()
+
+
+def find_wordnet() -> pathlib.Path:
+    """Path of the WordNet corpus installed for nltk, as a directory or a zip file, without downloading it."""
+    import nltk
+    for resource in ["corpora/wordnet", "corpora/wordnet.zip"]:
+        try:
+            return pathlib.Path(nltk.data.find(resource).path)
+        except LookupError:
+            pass
+    raise FileNotFoundError("WordNet not found among nltk's data: install it via `python -m nltk.downloader wordnet`")
+
+
+def known_words(wordnet: pathlib.Path) -> typing.Set[str]:
+    """Lowercase words which nltk's `wordnet.synsets` finds synsets for, given WordNet's files in `wordnet`.
+
+    These are the lemmas of some part of speech, and their forms which WordNet's exception lists (if any) or the
+    morphological substitutions (otherwise) map back to them.
+    """
+    read = _wordnet_files(wordnet)
+    words = set()
+    for pos, suffix in POS_FILES.items():
+        lemmas = {line.split(" ", 1)[0] for line in read(f"index.{suffix}") if line and not line.startswith(" ")}
+        exceptions = dict()
+        for line in read(f"{suffix}.exc"):
+            terms = line.split()
+            if terms:
+                exceptions[terms[0]] = terms[1:]
+        candidates = set(lemmas)
+        for lemma in lemmas:
+            for old, new in MORPHOLOGICAL_SUBSTITUTIONS[pos]:
+                if lemma.endswith(new):
+                    candidates.add(lemma[:len(lemma) - len(new)] + old)
+        words.update(word for word in candidates if word not in exceptions)
+        words.update(word for word, forms in exceptions.items() if any(f in lemmas for f in [word] + forms))
+    return words
+
+
+def build(output: pathlib.Path = PATH_LEMMAS, wordnet: pathlib.Path = None) -> int:
+    """Writes the words known to WordNet into `output`, one per line, sorted bytewise, returning how many."""
+    wordnet = wordnet or find_wordnet()
+    words = sorted(word.encode("utf-8") for word in known_words(wordnet))
+    with atomic_write(output, "wb") as file:
+        file.write(b"".join(word + b"\n" for word in words))
+    logger.debug("Wrote %d words known to WordNet %s into %s", len(words), wordnet, output)
+    return len(words)
+
+
+class Lemmas:
+    """Words known to WordNet, looked up by binary search into a file built by `build`, mapped in memory."""
+
+    def __init__(self, path: pathlib.Path = PATH_LEMMAS):
+        self._path = path
+        with open(path, "rb") as file:
+            self._words = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+
+    @property
+    def path(self) -> pathlib.Path:
+        return self._path
+
+    def __contains__(self, word: str) -> bool:
+        words = self._words
+        target = word.encode("utf-8")
+        # lo is always the start of a line, and hi the start of a line or the end of the file
+        lo, hi = 0, len(words)
+        while lo < hi:
+            start = words.rfind(b"\n", lo, (lo + hi) // 2) + 1 or lo
+            end = words.find(b"\n", start, hi)
+            current = words[start:end]
+            if current < target:
+                lo = end + 1
+            elif current > target:
+                hi = start
+            else:
+                return True
+        return False
+
+
+_lemmas: Lemmas | None = None
+_lemmas_lock = threading.Lock()
+
+
+def lemmas() -> Lemmas:
+    """The words known to WordNet, from `PATH_LEMMAS`, which is built from the local nltk data if missing."""
+    global _lemmas
+    if _lemmas is None:
+        with _lemmas_lock:
+            if _lemmas is None:
+                if not PATH_LEMMAS.exists():
+                    logger.warning("Missing %s: building it from WordNet", PATH_LEMMAS)
+                    try:
+                        build(PATH_LEMMAS)
+                    except (ImportError, FileNotFoundError) as e:
+                        raise FileNotFoundError(f"Missing {PATH_LEMMAS}, which cannot be built from nltk's WordNet "
+                                                f"({e}): build it via `python -m kgfiller.lemmas --wordnet ...`") from e
+                _lemmas = Lemmas(PATH_LEMMAS)
+    return _lemmas
+
+
+@functools.lru_cache(maxsize=DEFAULT_LEMMAS_CACHE_SIZE)
+def is_known_word(word: str) -> bool:
+    """Whether WordNet has synsets for `word`, as nltk's `len(wordnet.synsets(word)) > 0`."""
+    return word.lower() in lemmas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m kgfiller.lemmas",
+                                     description="Build the sorted file of the words WordNet has synsets for")
+    parser.add_argument("--wordnet", type=pathlib.Path, default=None,
+                        help="WordNet's directory or zip file (default: the one installed for nltk)")
+    parser.add_argument("--output", type=pathlib.Path, default=PATH_LEMMAS, help="file to write")
+    args = parser.parse_args()
+    count = build(args.output, args.wordnet)
+    print(f"wrote {count} words into {args.output}")
@@ -0,0 +1,156 @@
+from kgfiller import logger, Commitable
+from kgfiller.ai import query_cache
+from kgfiller.checkpoint import Checkpoint
+from kgfiller.git import DataRepository
+from kgfiller.strategies import *
+from kgfiller.text import gather_possible_duplicates, gather_all_instances_of_class_without_subclasses, \
+    cluster_possible_duplicates
+from kgfiller.utils import get_env_var
+
+
+Queries = typing.Dict[str, typing.List[str]]
+
+DUPLICATES_MAX_CLUSTER = int(get_env_var("DUPLICATES_MAX_CLUSTER", "10",
+                                         "Max amount of possible duplicates to be checked with one query"))
+
+
+def maybe_commit(kg: KnowledgeGraph, repo: DataRepository, checkpoint: Checkpoint, commit: Commitable):
+    # files are written right before actually committing them, possibly along with other edits
+    repo.maybe_commit(commit, kg.save_edits, checkpoint.save, query_cache().sync)
+
+
+def export(kg: KnowledgeGraph, repo: DataRepository, step: "Step"):
+    """Commits pending edits, then the ontology file as rewritten from the quadstore, if any."""
+    repo.flush()
+    kg.save()
+    repo.commit_edits_if_any(f"export the ontology after {step.__name__}", kg.path)
+
+
+def instances_for_classes(kg: KnowledgeGraph, queries: Queries, classes: typing.Iterable[owlready.ThingClass]) -> typing.Iterable[QueryPlan]:
+    for cls in classes:
+        logger.debug('Step 1. Checking class "{}"...'.format(cls))
+        yield find_instances_for_class(kg, cls, queries['instance'], defer=True)
+
+
+def relations_for_instances(kg: KnowledgeGraph, queries: Queries, instances: typing.Iterable[owlready.Thing]) -> typing.Iterable[QueryPlan]:
+    for instance in instances:
+        logger.debug('Step 3. Checking instance "{}"...'.format(instance))
+        yield find_related_instances(kg, instance, kg.onto.ingredientOf, kg.onto.Edible, queries['relation'],
+                                     instance_as_object=True, defer=True)
+
+
+def find_food_instances(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, checkpoint: Checkpoint = None):
+    logger.debug('Step 1. Finding food instances...')
+    checkpoint = checkpoint or Checkpoint(None)
+    step = find_food_instances.__name__
+    classes = [cls for cls in kg.visit_classes_depth_first() if not kg.subtype(cls, kg.onto.Recipe)]
+    classes = checkpoint.pending(step, classes)
+    for cls, commit in zip(classes, apply_concurrently(instances_for_classes(kg, queries, classes))):
+        checkpoint.advance(step, cls.name)
+        maybe_commit(kg, repo, checkpoint, commit)
+
+
+def find_recipe_instances(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, checkpoint: Checkpoint = None):
+    logger.debug('Step 2. Finding recipe instances...')
+    checkpoint = checkpoint or Checkpoint(None)
+    step = find_recipe_instances.__name__
+    classes = [cls for cls in kg.visit_classes_depth_first() if kg.subtype(cls, kg.onto.Recipe, strict=True)]
+    for cls in checkpoint.pending(step, classes):
+        logger.debug('Step 2. Finding recipe instances for class "{}"...'.format(cls))
+        commit = find_instances_for_recipes(kg, cls, queries['recipe'])
+        checkpoint.advance(step, cls.name)
+        maybe_commit(kg, repo, checkpoint, commit)
+
+
+def find_relation_instances(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, checkpoint: Checkpoint = None):
+    logger.debug('Step 3. Finding relation instances...')
+    checkpoint = checkpoint or Checkpoint(None)
+    step = find_relation_instances.__name__
+    recipes = checkpoint.pending(step, kg.onto.Recipe.instances())
+    for recipe, commit in zip(recipes, apply_concurrently(relations_for_instances(kg, queries, recipes), RELATION_PARALLELISM)):
+        checkpoint.advance(step, recipe.name)
+        maybe_commit(kg, repo, checkpoint, commit)
+
+
+def refine_food_instances(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, checkpoint: Checkpoint = None):
+    logger.debug('Step 4. Refining position of food instances...')
+    checkpoint = checkpoint or Checkpoint(None)
+    step = refine_food_instances.__name__
+    Recipe = kg.onto.Recipe
+    rebalance_queries = queries['rebalance']
+    already_met_instances = set()
+    for cls in checkpoint.pending(step, kg.visit_classes_depth_first()):
+        if not kg.is_leaf(cls):
+            classes_to_avoid = [Recipe] if not kg.subtype(cls, Recipe) else None
+            instances = gather_all_instances_of_class_without_subclasses(cls, kg)
+            for instance in checkpoint.pending(step, instances, parents=[cls.name]):
+                if instance not in already_met_instances:
+                    logger.debug('Step 4. Checking instance "{}" in class "{}"...'.format(instance, cls))
+                    already_met_instances.add(instance)
+                    commit = move_to_most_adequate_subclass(kg, instance, cls, leaf_descendants, rebalance_queries, classes_to_avoid=classes_to_avoid)
+                    if not commit.should_commit:
+                        commit.should_commit = True
+                        maybe_commit(kg, repo, checkpoint, commit)
+                        commit = move_to_most_adequate_subclass(kg, instance, cls, all_descendants, rebalance_queries, classes_to_avoid=classes_to_avoid)
+                    commit.should_commit = True
+                    # the instance may have been moved elsewhere, hence it is resumed from by name, not position
+                    checkpoint.mark_done(step, [cls.name], instance.name)
+                    maybe_commit(kg, repo, checkpoint, commit)
+        checkpoint.advance(step, cls.name)
+
+
+def check_duplicate_instances(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, checkpoint: Checkpoint = None):
+    logger.debug('Step 5. Checking duplicate food instances...')
+    checkpoint = checkpoint or Checkpoint(None)
+    step = check_duplicate_instances.__name__
+    cluster_queries = queries.get('duplicate_cluster')
+    for cls in checkpoint.pending(step, kg.visit_classes_depth_first()):
+        if not kg.subtype(cls, kg.onto.Recipe):
+            possible_duplicates = gather_possible_duplicates(cls, kg)
+            # logger.debug('Step 5. Possible duplicates in class "{}" are: {}'.format(cls, possible_duplicates))
+            clusters = cluster_possible_duplicates(possible_duplicates)
+            for cluster, couples in clusters:
+                # merges change the clusters of a resumed class: the ones whose instances were all checked are skipped
+                names = [instance.name for instance in cluster]
+                if checkpoint.is_done(step, [cls.name], *names):
+                    continue
+                if cluster_queries and 2 < len(cluster) <= DUPLICATES_MAX_CLUSTER:
+                    logger.debug('Step 5. Checking cluster "{}" in class "{}"...'.format(cluster, cls))
+                    commit = check_duplicates_cluster(kg, cls, cluster, cluster_queries)
+                    if commit.should_commit:
+                        checkpoint.mark_done(step, [cls.name], *names)
+                        maybe_commit(kg, repo, checkpoint, commit)
+                        continue
+                for possible_duplicates_couple in couples:
+                    if not all(kg.alive(instance, cls) for instance in possible_duplicates_couple):
+                        # merged away by a previous couple of the same cluster
+                        continue
+                    logger.debug('Step 5. Checking couple "{}" in class "{}"...'.format(possible_duplicates_couple, cls))
+                    commit = check_duplicates(kg, cls, possible_duplicates_couple, queries['duplicate'])
+                    maybe_commit(kg, repo, checkpoint, commit)
+                checkpoint.mark_done(step, [cls.name], *names)
+        checkpoint.advance(step, cls.name)
+
+
+Step = typing.Callable[[KnowledgeGraph, DataRepository, Queries, Checkpoint], None]
+
+STEPS: typing.List[Step] = [
+    find_food_instances,
+    find_recipe_instances,
+    find_relation_instances,
+    refine_food_instances,
+    check_duplicate_instances,
+]
+
+
+def fill(kg: KnowledgeGraph, repo: DataRepository, queries: Queries, steps: typing.Iterable[Step] = STEPS,
+         checkpoint: Checkpoint = None):
+    checkpoint = checkpoint or Checkpoint(None)
+    for step in steps:
+        if checkpoint.is_completed(step.__name__):
+            logger.info("Skipping step %s, completed before", step.__name__)
+            continue
+        step(kg, repo, queries, checkpoint)
+        export(kg, repo, step)
+        checkpoint.complete(step.__name__)
+    checkpoint.clear()
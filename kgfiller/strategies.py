@@ -1,15 +1,16 @@
+import collections
+import re
 import typing
+from concurrent.futures import ThreadPoolExecutor
 
 import owlready2 as owlready
 
 from kgfiller import logger, Commitable, Commit
-from kgfiller.ai import ai_query, AiQuery, load_api_from_env
-from kgfiller.kg import KnowledgeGraph, human_name, is_leaf, subtype
+from kgfiller.ai import ai_query, AiQuery
+from kgfiller.kg import KnowledgeGraph, human_name
 from kgfiller.text import Item
 from kgfiller.utils import first_or_none, get_env_var
 
-load_api_from_env()
-
 CLASS_NAME = "__CLASS_NAME__"
 CLASS_NAME_FANCY = "__CLASS_NAME_FANCY_"
 INSTANCE_NAME = "__INSTANCE_NAME__"
@@ -21,10 +22,18 @@ CLASS_LIST_FANCY = "__CLASS_LIST_FANCY_"
 INSTANCE_LIST = "__INSTANCE_LIST__"
 INSTANCE_LIST_FANCY = "__INSTANCE_LIST_FANCY_"
 
+PATTERN_CLUSTER_LINE_PREFIX = re.compile(r"^\s*(?:\d+[.)]|[-*+])\s*")
+PATTERN_CLUSTER_NONE = re.compile(r"^\W*none\W*$", re.IGNORECASE | re.MULTILINE)
+CLUSTER_SEPARATOR = "|"
+
 
 DEFAULT_MAX_RETRIES = 2
 DEFAULT_LIMIT = int(get_env_var("LIMIT", "100", "AI prompt limit"))
 N_RECIPES = get_env_var("N_RECIPES", "50", "Number of recipes to query for")
+# queries to the Hugging API are performed one at a time whatever the parallelism, see kgfiller.ai.hugging
+DEFAULT_PARALLELISM = int(get_env_var("PARALLELISM", "1", "Number of concurrent AI queries"))
+RELATION_PARALLELISM = int(get_env_var("RELATION_PARALLELISM", str(DEFAULT_PARALLELISM),
+                                       "Number of concurrent AI queries for relations"))
 
 
 def _apply_replacements(pattern: str, **replacements) -> str:
@@ -55,17 +64,26 @@ class QueryProcessor(Commit):
     def process(self, kg: KnowledgeGraph, query: AiQuery):
         raise NotImplementedError()
 
-    def __call__(self, query: AiQuery) -> bool:
+    def accept(self, query: AiQuery) -> bool:
+        """Registers `query` and checks whether its answer is admissible, without editing the knowledge graph."""
         self._queries.append(query)
         self.files.append(query.cache_path)
-        if not self.admissible(self._kg, query):
-            return False
-        results = self.process(self._kg, query)
+        return self.admissible(self._kg, query)
+
+    def apply(self, query: AiQuery):
+        """Edits the knowledge graph according to the answer of a previously accepted `query`."""
+        with self._kg.origin(query.cache_key):
+            results = self.process(self._kg, query)
         self.message = self.final_message(self._kg, query, *results)
         if not self.message:
             raise ValueError("No message set for query")
         if self.description:
             self.description = self.description.strip()
+
+    def __call__(self, query: AiQuery) -> bool:
+        if not self.accept(query):
+            return False
+        self.apply(query)
         return True
 
     def describe(self, msg: str, prefix='\n', suffix=''):
@@ -109,6 +127,28 @@ class MultipleResultsQueryProcessor(QueryProcessor):
         raise NotImplementedError()
 
 
+class InstancesQueryProcessor(MultipleResultsQueryProcessor):
+    """Adds all the items of an answer as instances of `cls`, in one go."""
+
+    def __init__(self, cls: owlready.ThingClass):
+        super().__init__()
+        self._cls = cls
+
+    def final_message(self, kg: KnowledgeGraph, query: AiQuery, *results) -> str:
+        return f"add {len(results)} instances to class {self._cls.name} from AI answer"
+
+    def process(self, kg: KnowledgeGraph, query: AiQuery):
+        self.describe(f"Query: {query.question}.\nAnswers:")
+        added = kg.add_instances(self._cls, [result.value for result in self._results])
+        for result, addition in zip(self._results, added):
+            if addition.created:
+                self.describe(f"- {result} => adding instance {addition.instance.name} to class {self._cls.name}")
+            else:
+                self.describe(f"- {result} => instance {addition.instance.name} already exists, "
+                              f"classifying it as {self._cls.name}")
+        return [addition.instance for addition in added]
+
+
 class SingleResultQueryProcessor(QueryProcessor):
     def __init__(self):
         super().__init__()
@@ -129,69 +169,114 @@ class SingleResultQueryProcessor(QueryProcessor):
         raise NotImplementedError()
 
 
+class QueryPlan:
+    """A sequence of questions to be asked to the AI until one of them gets an admissible answer.
+
+    Resolving the plan only involves AI queries and answer parsing, hence it can be done in a worker thread.
+    Applying the plan edits the knowledge graph, hence it should always be done by one thread at a time.
+    """
+
+    def __init__(self,
+                 kg: KnowledgeGraph,
+                 questions: typing.List[str],
+                 query_processor: QueryProcessor,
+                 max_retries: int,
+                 limit: int = DEFAULT_LIMIT):
+        self._questions = questions
+        self._query_processor = query_processor
+        self._max_retries = max_retries
+        self._limit = limit
+        self._query = None
+        self._resolved = False
+        query_processor.reset(kg)
+
+    def resolve(self) -> "QueryPlan":
+        if self._resolved:
+            return self
+        for question in self._questions:
+            for attempt in range(0, self._max_retries):
+                query = ai_query(question=question, attempt=attempt if attempt > 0 else None, limit=self._limit)
+                if not self._query_processor.accept(query):
+                    logger.warning("No results for query '%s', AI answer: %s", query.question, query.result_text)
+                    continue
+                self._query = query
+                self._resolved = True
+                return self
+        self._resolved = True
+        return self
+
+    def apply(self) -> Commitable:
+        self.resolve()
+        if self._query is None:
+            self._query_processor.inconclusive()
+        else:
+            self._query_processor.apply(self._query)
+            self._query_processor.describe_caches()
+        return self._query_processor
+
+
 def _make_queries(kg: KnowledgeGraph,
                   queries: typing.List[str],
                   query_processor: QueryProcessor,
                   max_retries: int,
                   limit: int = DEFAULT_LIMIT,
-                  **replacements) -> Commitable:
+                  defer: bool = False,
+                  **replacements) -> Commitable | QueryPlan:
     logger.debug(' NEW QUERY! '.center(60, '='))
     questions = [_apply_replacements(pattern, **replacements) for pattern in queries]
-    query_processor.reset(kg)
-    for question in questions:
-        for attempt in range(0, max_retries):
-            query = ai_query(question=question, attempt=attempt if attempt > 0 else None, limit=limit)
-            if not query_processor(query):
-                logger.warning("No results for query '%s', AI answer: %s", query.question, query.result_text)
-                continue
-            query_processor.describe_caches()
-            return query_processor
-    query_processor.inconclusive()
-    return query_processor
+    plan = QueryPlan(kg, questions, query_processor, max_retries, limit)
+    return plan if defer else plan.apply()
+
+
+def apply_concurrently(plans: typing.Iterable[QueryPlan],
+                       parallelism: int = DEFAULT_PARALLELISM) -> typing.Iterator[Commitable]:
+    """Resolves up to `parallelism` plans at a time in a thread pool, yet applies them one by one, in the same
+    order they are provided, so that the knowledge graph evolves exactly as in a sequential run.
+    """
+    if parallelism <= 1:
+        for plan in plans:
+            yield plan.apply()
+        return
+    executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="kgfiller-query")
+    pending = collections.deque()
+    try:
+        for plan in plans:
+            pending.append(executor.submit(plan.resolve))
+            if len(pending) >= 2 * parallelism:
+                yield pending.popleft().result().apply()
+        while pending:
+            yield pending.popleft().result().apply()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def find_instances_for_class(kg: KnowledgeGraph,
                              cls: owlready.ThingClass,
                              queries: typing.List[str],
-                             max_retries: int = DEFAULT_MAX_RETRIES) -> Commitable:
-    class FindInstancesQueryProcessor(MultipleResultsQueryProcessor):
-        def final_message(self, kg: KnowledgeGraph, query: AiQuery, *results) -> str:
-            return f"add {len(results)} instances to class {cls.name} from AI answer"
-
-        def process_result(self, kg: KnowledgeGraph, query: AiQuery, result: Item):
-            instance = kg.add_instance(cls, result.value)
-            self.describe(f"- {result} => adding instance {instance.name} to class {cls.name}")
-            return instance
-
+                             max_retries: int = DEFAULT_MAX_RETRIES,
+                             defer: bool = False) -> Commitable | QueryPlan:
     replacements = {
         CLASS_NAME: cls.name,
         CLASS_NAME_FANCY: human_name(cls),
     }
-    return _make_queries(kg, queries, FindInstancesQueryProcessor(), max_retries=max_retries, **replacements)
+    return _make_queries(kg, queries, InstancesQueryProcessor(cls), max_retries=max_retries, defer=defer,
+                         **replacements)
 
 def find_instances_for_recipes(kg: KnowledgeGraph,
                              cls: owlready.ThingClass,
                              queries: typing.List[str],
                              max_retries: int = DEFAULT_MAX_RETRIES) -> Commitable:
-    class FindInstancesQueryProcessor(MultipleResultsQueryProcessor):
+    class FindInstancesQueryProcessor(InstancesQueryProcessor):
 
         def admissible(self, kg: KnowledgeGraph, query: AiQuery) -> bool:
             self._results = query.result_to_list(ignore_ands=True)
             return len(self._results) > 0
 
-        def final_message(self, kg: KnowledgeGraph, query: AiQuery, *results) -> str:
-            return f"add {len(results)} instances to class {cls.name} from AI answer"
-
-        def process_result(self, kg: KnowledgeGraph, query: AiQuery, result: Item):
-            instance = kg.add_instance(cls, result.value)
-            self.describe(f"- {result} => adding instance {instance.name} to class {cls.name}")
-            return instance
-
     replacements = {
         '__N_RECIPES_': N_RECIPES,
         CLASS_NAME_FANCY: human_name(cls),
     }
-    return _make_queries(kg, queries, FindInstancesQueryProcessor(), max_retries=max_retries, limit=1000, **replacements)
+    return _make_queries(kg, queries, FindInstancesQueryProcessor(cls), max_retries=max_retries, limit=1000, **replacements)
 
 
 def find_related_instances(kg: KnowledgeGraph,
@@ -200,24 +285,26 @@ def find_related_instances(kg: KnowledgeGraph,
                            default_class: owlready.ThingClass,
                            queries: typing.List[str],
                            instance_as_object: bool = False,
-                           max_retries: int = DEFAULT_MAX_RETRIES) -> Commitable:
+                           max_retries: int = DEFAULT_MAX_RETRIES,
+                           defer: bool = False) -> Commitable | QueryPlan:
     class FindRelatedInstancesQueryProcessor(MultipleResultsQueryProcessor):
         def final_message(self, kg: KnowledgeGraph, query: AiQuery, *results) -> str:
             return f"add {len(results)} instances to class {default_class.name}, and as many relations " \
                    f"to instance {instance.name} from AI answer"
 
-        def process_result(self, kg: KnowledgeGraph, query: AiQuery, result: Item):
-            results = []
-            for word in result.split_by_words():
-                new_instance = kg.add_instance(default_class, word)
+        def process(self, kg: KnowledgeGraph, query: AiQuery):
+            self.describe(f"Query: {query.question}.\nAnswers:")
+            words = [(result, word) for result in self._results for word in result.split_by_words()]
+            added = kg.add_instances(default_class, [word for _, word in words])
+            for (result, _), addition in zip(words, added):
+                new_instance = addition.instance
                 if instance_as_object:
                     kg.add_property(new_instance, relation, instance)
                 else:
                     kg.add_property(instance, relation, new_instance)
                 self.describe(f"- {result} => adding instance {new_instance.name} to class {default_class.name}, and "
                               f"relate it to {instance.name} as {relation.name}")
-                results.append(new_instance)
-            return results
+            return [addition.instance for addition in added]
 
     replacements = {
         INSTANCE_NAME: instance.name,
@@ -225,7 +312,8 @@ def find_related_instances(kg: KnowledgeGraph,
         RELATION_NAME: relation.name,
         RELATION_NAME_FANCY: human_name(relation),
     }
-    return _make_queries(kg, queries, FindRelatedInstancesQueryProcessor(), max_retries=max_retries, **replacements)
+    return _make_queries(kg, queries, FindRelatedInstancesQueryProcessor(), max_retries=max_retries, defer=defer,
+                         **replacements)
 
 
 def move_to_most_adequate_class(kg: KnowledgeGraph,
@@ -267,29 +355,29 @@ def move_to_most_adequate_class(kg: KnowledgeGraph,
     return _make_queries(kg, queries, MoveToMostAdequateClassQueryProcessor(), max_retries=max_retries, **replacements)
 
 
-SubClassSelector = typing.Callable[[owlready.ThingClass], typing.Iterable[owlready.ThingClass]]
+SubClassSelector = typing.Callable[[KnowledgeGraph, owlready.ThingClass], typing.Iterable[owlready.ThingClass]]
 
 
-def avoid_classes(clss: typing.Iterable[owlready.ThingClass], classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
+def avoid_classes(kg: KnowledgeGraph, clss: typing.Iterable[owlready.ThingClass], classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
     if classes_to_avoid is None:
         return clss
     else:
-        return (cls for cls in clss if not any([subtype(cls, cls_to_avoid) for cls_to_avoid in classes_to_avoid]))
+        return (cls for cls in clss if not any([kg.subtype(cls, cls_to_avoid) for cls_to_avoid in classes_to_avoid]))
 
 
-def direct_subclasses(cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
+def direct_subclasses(kg: KnowledgeGraph, cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
     sub_classes = cls.subclasses()
-    return avoid_classes(clss=sub_classes, classes_to_avoid=classes_to_avoid)
+    return avoid_classes(kg, clss=sub_classes, classes_to_avoid=classes_to_avoid)
 
 
-def all_descendants(cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
+def all_descendants(kg: KnowledgeGraph, cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
     descendants = cls.descendants()
-    return avoid_classes(clss=descendants, classes_to_avoid=classes_to_avoid)
+    return avoid_classes(kg, clss=descendants, classes_to_avoid=classes_to_avoid)
 
 
-def leaf_descendants(cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
-    leaf_descents = (c for c in all_descendants(cls) if is_leaf(c))
-    return avoid_classes(clss=leaf_descents, classes_to_avoid=classes_to_avoid)
+def leaf_descendants(kg: KnowledgeGraph, cls: owlready.ThingClass, classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> typing.Iterable[owlready.ThingClass]:
+    leaf_descents = (c for c in all_descendants(kg, cls) if kg.is_leaf(c))
+    return avoid_classes(kg, clss=leaf_descents, classes_to_avoid=classes_to_avoid)
 
 
 def move_to_most_adequate_subclass(kg: KnowledgeGraph,
@@ -299,7 +387,7 @@ def move_to_most_adequate_subclass(kg: KnowledgeGraph,
                                    queries: typing.List[str],
                                    max_retries: int = DEFAULT_MAX_RETRIES,
                                    classes_to_avoid: typing.Iterable[owlready.ThingClass] = None) -> Commitable:
-    classes = subclass_selector(root_class, classes_to_avoid=classes_to_avoid)
+    classes = subclass_selector(kg, root_class, classes_to_avoid=classes_to_avoid)
     return move_to_most_adequate_class(kg, instance, classes, queries, max_retries=max_retries)
 
 
@@ -349,3 +437,82 @@ def check_duplicates(kg: KnowledgeGraph,
     replacements[INSTANCE_LIST] = " and ".join(sorted(list(replacements[INSTANCE_LIST])))
     replacements[INSTANCE_LIST_FANCY] = " and ".join(sorted(list(replacements[INSTANCE_LIST_FANCY])))
     return _make_queries(kg, queries, CheckDuplicatesClassQueryProcessor(), max_retries=max_retries, **replacements)
+
+
+def parse_duplicates_cluster(answer: str, instances_by_name: typing.Dict[str, typing.Any]) -> typing.List[list] | None:
+    """Groups of duplicates in `answer`, one per line, as lists of the values of `instances_by_name` in its order,
+    or None if it is inadmissible. Each line must either just say none, or list names separated by
+    `CLUSTER_SEPARATOR`, each of which is exactly one of the names in `instances_by_name` (case aside):
+    anything else, e.g. prose, makes the whole answer inadmissible, rather than risking merges it does not mean."""
+    order = list(dict.fromkeys(instances_by_name.values()))
+    lowered = dict()
+    for name, instance in instances_by_name.items():
+        lowered.setdefault(name.lower(), instance)
+    groups = []
+    for line in answer.splitlines():
+        line = PATTERN_CLUSTER_LINE_PREFIX.sub("", line).strip()
+        if not line or PATTERN_CLUSTER_NONE.match(line):
+            continue
+        group = []
+        for segment in line.split(CLUSTER_SEPARATOR):
+            segment = segment.strip()
+            instance = lowered.get(segment.lower(), lowered.get(segment.strip("'\"`.").lower()))
+            if instance is None:
+                return None
+            group.append(instance)
+        group = list(dict.fromkeys(group))
+        if len(group) > 1:
+            groups.append(sorted(group, key=order.index))
+    if not groups and not PATTERN_CLUSTER_NONE.search(answer):
+        return None
+    return groups
+
+
+def check_duplicates_cluster(kg: KnowledgeGraph,
+                             cls: owlready.ThingClass,
+                             possible_duplicates: typing.List[owlready.Thing],
+                             queries: typing.List[str],
+                             max_retries: int = DEFAULT_MAX_RETRIES) -> Commitable:
+    """Asks which ones among many `possible_duplicates` are duplicates at once, expecting one group of duplicates
+    per line, and merges each group into its first instance."""
+    instances_by_name = dict()
+    for instance in possible_duplicates:
+        for name in [human_name(instance), instance.name, instance.name.replace("_", " ")]:
+            instances_by_name.setdefault(name, instance)
+
+    class CheckDuplicatesClusterQueryProcessor(SingleResultQueryProcessor):
+
+        def final_message(self, kg: KnowledgeGraph, query: AiQuery, *results) -> str:
+            merged = [group for group in results[0] if len(group) > 1]
+            if merged:
+                return "merged " + "; ".join(" and ".join(i.name for i in group) for group in merged) + " together"
+            else:
+                return f"instances {', '.join(i.name for i in possible_duplicates)} were NOT merged together"
+
+        def parse_result(self, kg: KnowledgeGraph, query: AiQuery) -> typing.Any:
+            return parse_duplicates_cluster(query.result_text, instances_by_name)
+
+        def process_result(self, kg: KnowledgeGraph, query: AiQuery, result: typing.Any):
+            logger.debug('Query:\t{}\nAnswer:\t{}'.format(query.question, query.result_text))
+            merged = []
+            for group in result:
+                survivor = group[0]
+                merged_group = [survivor] + [i for i in group[1:] if kg.merge_instances(survivor, i, cls)]
+                self.describe(f"meaning that instances {', '.join(i.name for i in group)} are semantically identical.")
+                if len(merged_group) < len(group):
+                    self.describe(f"some instances not merged cause they were already merged previously.")
+                merged.append(merged_group)
+            if not result:
+                self.describe(f"meaning that instances {', '.join(i.name for i in possible_duplicates)} are different.")
+            return merged
+
+    names = sorted(f"'{instance.name}'" for instance in possible_duplicates)
+    fancy_names = sorted(f"'{human_name(instance)}'" for instance in possible_duplicates)
+    replacements = {
+        INSTANCE_LIST: ", ".join(names),
+        INSTANCE_LIST_FANCY: ", ".join(fancy_names),
+        CLASS_NAME: cls.name,
+        CLASS_NAME_FANCY: human_name(cls),
+    }
+    return _make_queries(kg, queries, CheckDuplicatesClusterQueryProcessor(), max_retries=max_retries,
+                         **replacements)
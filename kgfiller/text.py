@@ -1,13 +1,13 @@
+import collections
 import hashlib
 import re
 import typing
 from dataclasses import dataclass
-import nltk
-nltk.download('wordnet')
-from nltk.corpus import wordnet
 import owlready2 as owlready
 from difflib import SequenceMatcher
 
+from kgfiller.lemmas import is_known_word
+
 
 PATTERN_BULLETED = re.compile(r"[-*+]|[#]+")
 PATTERN_NUMBERED = re.compile(r"\d+.")
@@ -20,6 +20,8 @@ PATTERN_ITEM_WITH_OR_OPTION = re.compile(r"(.+?)(?:\s+or+\s+)(.+)")
 
 
 DEFAULT_SEPARATING_WORDS = {"and", "with", "or"}
+# instances are possible duplicates if their names have a common substring longer than this
+DUPLICATES_MIN_MATCH = 3
 
 
 def split_recursively(text: str, separators: typing.Iterable[str] = None) -> typing.Iterable[str]:
@@ -36,7 +38,7 @@ def split_recursively(text: str, separators: typing.Iterable[str] = None) -> typ
 
 def _is_meaningful_word(word: str) -> bool:
     if word:
-        return len(wordnet.synsets(word.split()[-1].lower())) > 0
+        return is_known_word(word.split()[-1].lower())
     return False
 
 
@@ -158,7 +160,9 @@ def itemize(text: str, ignore_ands: bool = False) -> typing.List[Item]:
     return items
 
 
-def gather_all_instances_of_class_without_subclasses(cls: owlready.ThingClass) -> typing.List[owlready.Thing]:
+def gather_all_instances_of_class_without_subclasses(cls: owlready.ThingClass, kg=None) -> typing.List[owlready.Thing]:
+    if kg is not None:
+        return kg.direct_instances(cls)
     all_instances = cls.instances()
     all_subclasses = list(cls.subclasses())
     all_subclasses_instances = [sub_cls.instances() for sub_cls in all_subclasses]
@@ -167,14 +171,63 @@ def gather_all_instances_of_class_without_subclasses(cls: owlready.ThingClass) -
     return superclass_instances
 
 
-def gather_possible_duplicates(cls: owlready.ThingClass) -> typing.List[typing.Tuple[owlready.Thing, owlready.Thing]]:
-    all_instances = gather_all_instances_of_class_without_subclasses(cls=cls)
+def _ngrams(text: str, n: int) -> typing.Set[str]:
+    return {text[i:i + n] for i in range(0, len(text) - n + 1)}
+
+
+def gather_possible_duplicates(cls: owlready.ThingClass, kg=None) -> \
+        typing.List[typing.Tuple[owlready.Thing, owlready.Thing]]:
+    all_instances = gather_all_instances_of_class_without_subclasses(cls=cls, kg=kg)
+    # names with a common substring longer than DUPLICATES_MIN_MATCH share at least one n-gram of that length + 1,
+    # hence only instances sharing n-grams are compared
+    n = DUPLICATES_MIN_MATCH + 1
+    names = [instance.name for instance in all_instances]
+    instances_by_ngram = collections.defaultdict(list)
+    candidates = []
+    for instance2_index, name in enumerate(names):
+        matching = set()
+        for ngram in _ngrams(name, n):
+            matching.update(instances_by_ngram[ngram])
+            instances_by_ngram[ngram].append(instance2_index)
+        candidates.extend((instance1_index, instance2_index) for instance1_index in matching)
+    candidates.sort()
     possible_duplicates = []
-    for instance1_index, instance1 in enumerate(all_instances):
-        for instance2 in all_instances[instance1_index+1:]:
-            first_name = instance1.name
-            second_name = instance2.name
+    for instance1_index, instance2_index in candidates:
+        first_name = names[instance1_index]
+        second_name = names[instance2_index]
+        # sharing an n-gram already implies a long enough match, except when SequenceMatcher's
+        # auto-junk heuristic kicks in, i.e. when the second sequence is at least 200 items long
+        if len(second_name) >= 200:
             match = SequenceMatcher(None, first_name, second_name).find_longest_match()
-            if match.size > 3:
-                possible_duplicates.append((instance1, instance2))
-    return possible_duplicates
\ No newline at end of file
+            if match.size <= DUPLICATES_MIN_MATCH:
+                continue
+        possible_duplicates.append((all_instances[instance1_index], all_instances[instance2_index]))
+    return possible_duplicates
+
+
+def cluster_possible_duplicates(possible_duplicates: typing.Iterable[typing.Tuple[owlready.Thing, owlready.Thing]]) \
+        -> typing.List[typing.Tuple[typing.List[owlready.Thing], typing.List[typing.Tuple[owlready.Thing, owlready.Thing]]]]:
+    """Groups possible duplicates into connected clusters, via union-find.
+
+    Each cluster is a list of instances, in order of first appearance, along with the pairs connecting them.
+    """
+    parents = dict()
+
+    def find(instance):
+        parents.setdefault(instance, instance)
+        while parents[instance] is not instance:
+            parents[instance] = parents[parents[instance]]
+            instance = parents[instance]
+        return instance
+
+    possible_duplicates = list(possible_duplicates)
+    for instance1, instance2 in possible_duplicates:
+        root1, root2 = find(instance1), find(instance2)
+        if root1 is not root2:
+            parents[root2] = root1
+    clusters = dict()
+    for instance in parents:
+        clusters.setdefault(find(instance), ([], []))[0].append(instance)
+    for pair in possible_duplicates:
+        clusters[find(pair[0])][1].append(pair)
+    return list(clusters.values())
@@ -1,22 +1,54 @@
+import contextlib
 import typing
 import os
 import pathlib
 import json
-import yaml
+import logging
+import logging.handlers
+import sys
+import threading
 
 
 PATH_REPO = pathlib.Path(__file__).parent.parent
 
+# settings are logged, rather than printed, as they are read (often upon import): records are kept here until
+# kgfiller's logger is created, see forward_settings_to
+_settings_logger = logging.getLogger("kgfiller.settings")
+_settings_logger.setLevel(logging.DEBUG)
+_settings_logger.propagate = False
+_settings_records = logging.handlers.MemoryHandler(capacity=sys.maxsize, flushLevel=logging.DEBUG)
+_settings_logger.addHandler(_settings_records)
+
+
+def forward_settings_to(target: logging.Logger):
+    """Logs the settings read so far, and the ones read later on, via `target`."""
+    _settings_records.setTarget(target)
+    _settings_records.flush()
+
+
 def get_env_var(name: str, default: str, description) -> str:
     value = os.environ[name] if name in os.environ else None
     if value:
-        print(f"Loaded {description} from environment variable {name}")
+        _settings_logger.debug(f"Loaded {description} from environment variable {name}")
     else:
-        print(f"Cannot load {description} because environment variable {name} is unset or empty. "
-              f"Using default value: {default}")
+        _settings_logger.debug(f"Cannot load {description} because environment variable {name} is unset or empty. "
+                               f"Using default value: {default}")
         value = default
     return value
 
+@contextlib.contextmanager
+def atomic_write(path: pathlib.Path, mode: str = "w", **kwargs) -> typing.Iterator[typing.IO]:
+    """Opens a temporary file next to `path`, which replaces `path` once written, so that readers never see partially
+    written files. If writing fails, `path` is left as it was and the temporary file is removed."""
+    temp = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(temp, mode, **kwargs) as file:
+            yield file
+        os.replace(temp, path)
+    finally:
+        temp.unlink(missing_ok=True)
+
+
 def load_queries_json():
     with open(os.path.join(PATH_REPO, "queries.json"), "r") as readfile:
         queries = json.load(readfile)
@@ -26,10 +58,13 @@ def load_queries_json():
     return queries[chosen_onto][chosen_api][chosen_model]
 
 def load_queries_yaml():
+    import yaml
     with open(os.path.join(PATH_REPO, "queries.yaml"), "r") as readfile:
         queries = yaml.safe_load(readfile)
     chosen_onto = get_env_var('ONTOLOGY', 'food', 'Chosen ontology')
     chosen_api = get_env_var('API', 'almaai', 'Chosen API')
+    if chosen_api == 'replay':
+        chosen_api = get_env_var('REPLAY_API', 'openai', 'Replayed API')
     chosen_model = get_env_var('MODEL', 'vicuna', 'Chosen model')
     return queries[chosen_onto][chosen_api][chosen_model]
 
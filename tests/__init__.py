@@ -0,0 +1,4 @@
+from kgfiller import logger
+
+# tests must not write into the repository's logs/ directory
+logger.disable_file_output()
@@ -0,0 +1,79 @@
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import kgfiller.ai as ai
+from kgfiller.ai.cache import YamlQueryCache
+
+
+class CountingAiQuery(ai.AiQuery):
+    calls = 0
+    lock = threading.Lock()
+
+    def _chat_completion_step(self):
+        with CountingAiQuery.lock:
+            CountingAiQuery.calls += 1
+        time.sleep(0.1)
+        return {'text': '1. Flour\n2. Yeast\n3. Salt'}
+
+    @classmethod
+    def _limit_error(cls):
+        return []
+
+    def _chat_completion_to_dict(self, chat_completion) -> dict:
+        return chat_completion
+
+    def _extract_text_from_result(self, result) -> str:
+        return result['text']
+
+
+class TestAiQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_cache = ai.DEFAULT_CACHE
+        ai.DEFAULT_CACHE = YamlQueryCache(pathlib.Path(self.directory.name))
+        CountingAiQuery.calls = 0
+
+    def tearDown(self):
+        ai.DEFAULT_CACHE = self.previous_cache
+        self.directory.cleanup()
+
+    def query(self, question: str = "Ingredients for bread") -> ai.AiQuery:
+        return ai.ai_query(question, model="counting", background="baker", api=CountingAiQuery)
+
+    def test_cached_result(self):
+        first = self.query()
+        self.assertEqual(first.result_text, '1. Flour\n2. Yeast\n3. Salt')
+        self.assertTrue(first.cache_path.exists())
+        second = self.query()
+        self.assertEqual(second.result_text, first.result_text)
+        self.assertEqual(CountingAiQuery.calls, 1)
+
+    def test_concurrent_identical_queries_are_performed_once(self):
+        queries = [self.query() for _ in range(8)]
+        threads = [threading.Thread(target=lambda q=q: q.result) for q in queries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(CountingAiQuery.calls, 1)
+        self.assertEqual({q.result_text for q in queries}, {'1. Flour\n2. Yeast\n3. Salt'})
+        self.assertEqual(list(pathlib.Path(self.directory.name).iterdir()), [queries[0].cache_path])
+
+    def test_concurrent_lazy_loading_of_the_cache(self):
+        def load(directory: pathlib.Path) -> YamlQueryCache:
+            time.sleep(0.05)
+            return YamlQueryCache(pathlib.Path(self.directory.name))
+        ai.DEFAULT_CACHE = None
+        with mock.patch.dict(os.environ, {"CACHE": "yaml"}), \
+                mock.patch.object(YamlQueryCache, "in_directory", side_effect=load) as loader:
+            threads = [threading.Thread(target=ai.query_cache) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(loader.call_count, 1)
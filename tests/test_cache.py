@@ -0,0 +1,93 @@
+import pathlib
+import tempfile
+import unittest
+import yaml
+from kgfiller.ai.cache import CacheRecord, YamlQueryCache, SqliteQueryCache, MemoryQueryCache, copy_records, encode, \
+    decode
+
+
+def _record(index: int) -> CacheRecord:
+    completion = {'choices': [{'message': {'content': f'1. Flour\n2. Yeast\n3. Salt #{index}'}}]}
+    header = f"Cache for query: question {index}\n(api: OpenAiQuery, model: gpt-3.5-turbo, limit: 100)"
+    return CacheRecord(f"{index:064x}", header, encode(completion))
+
+
+class TestEncodings(unittest.TestCase):
+
+    completion = {'text': '1. Flour\n2. Yeast: fresh\n3. Salt', 'usage': {'total_tokens': 12}}
+
+    def test_both_encodings_are_decoded(self):
+        for encoding in ['json', 'yaml']:
+            self.assertEqual(decode(encode(self.completion, encoding)), self.completion)
+
+    def test_json_is_yaml_too(self):
+        self.assertEqual(yaml.safe_load(encode(self.completion, 'json')), self.completion)
+
+    def test_yaml_looking_like_json(self):
+        self.assertEqual(decode("{text: flour}\n"), {'text': 'flour'})
+
+
+class TestQueryCaches(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_yaml_roundtrip(self):
+        cache = YamlQueryCache(self.path)
+        record = _record(1)
+        self.assertNotIn(record.key, cache)
+        cache.put(record)
+        self.assertIn(record.key, cache)
+        self.assertEqual(cache.get(record.key), record)
+        self.assertEqual(cache.path(record.key).name, f"cache-{record.key}.yml")
+        self.assertEqual(list(cache.keys()), [record.key])
+        cache.discard(record.key)
+        self.assertIsNone(cache.get(record.key))
+
+    def test_sqlite_roundtrip(self):
+        cache = SqliteQueryCache(self.path / "cache.sqlite3", batch_size=4)
+        records = [_record(i) for i in range(10)]
+        cache.put_many(records[:3])
+        self.assertIn(records[0].key, cache)
+        self.assertEqual(cache.get(records[0].key).completion, records[0].completion)
+        cache.put_many(records[3:])
+        self.assertEqual(cache.get_many(r.key for r in records), {r.key: r for r in records})
+        cache.discard(records[0].key)
+        self.assertNotIn(records[0].key, cache)
+        cache.close()
+        reopened = SqliteQueryCache(self.path / "cache.sqlite3")
+        self.assertEqual(list(reopened.keys()), [r.key for r in records[1:]])
+        reopened.close()
+
+    def test_import_export(self):
+        yaml_cache = YamlQueryCache(self.path / "yaml")
+        (self.path / "yaml").mkdir()
+        records = [_record(i) for i in range(5)]
+        yaml_cache.put_many(records)
+        sqlite_cache = SqliteQueryCache(self.path / "cache.sqlite3")
+        self.assertEqual(copy_records(yaml_cache, sqlite_cache, batch_size=2), 5)
+        exported = YamlQueryCache(self.path / "exported")
+        (self.path / "exported").mkdir()
+        copy_records(sqlite_cache, exported)
+        for record in records:
+            self.assertEqual(exported.path(record.key).read_text(), yaml_cache.path(record.key).read_text())
+        sqlite_cache.close()
+
+    def test_memo(self):
+        records = [_record(i) for i in range(4)]
+        memo = MemoryQueryCache(YamlQueryCache(self.path), max_entries=2)
+        memo.put_many(records[:2])
+        self.assertIs(memo.get(records[0].key), records[0])
+        memo.put(records[2])
+        self.assertEqual(len(memo), 2)
+        self.assertEqual(memo.stats.evictions, 1)
+        self.assertEqual(memo.get(records[1].key), records[1])
+        self.assertEqual((memo.stats.hits, memo.stats.misses), (1, 1))
+        memo.max_size = records[3].size
+        memo.put(records[3])
+        self.assertEqual(len(memo), 1)
+        self.assertIn(records[0].key, memo)
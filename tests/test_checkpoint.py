@@ -0,0 +1,87 @@
+import pathlib
+import tempfile
+import unittest
+import git
+from kgfiller import logger
+from kgfiller.checkpoint import Checkpoint
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "checkpoint.json"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fresh_checkpoints_skip_nothing(self):
+        checkpoint = Checkpoint(self.path)
+        self.assertFalse(checkpoint.is_completed("step1"))
+        self.assertEqual(checkpoint.pending("step1", ["a", "b"], key=str), ["a", "b"])
+
+    def test_progress_is_resumed(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.complete("step1")
+        checkpoint.advance("step2", "b")
+        checkpoint.save()
+        resumed = Checkpoint(self.path)
+        self.assertTrue(resumed.is_completed("step1"))
+        self.assertEqual(resumed.pending("step2", ["a", "b", "c"], key=str), ["c"])
+        self.assertEqual(resumed.pending("step3", ["a", "b", "c"], key=str), ["a", "b", "c"])
+
+    def test_nested_cursors(self):
+        checkpoint = Checkpoint(None)
+        checkpoint.advance("step", "b", "y")
+        self.assertEqual(checkpoint.pending("step", ["a", "b", "c"], key=str), ["b", "c"])
+        self.assertEqual(checkpoint.pending("step", ["x", "y", "z"], key=str, parents=["b"]), ["z"])
+        self.assertEqual(checkpoint.pending("step", ["x", "y", "z"], key=str, parents=["c"]), ["x", "y", "z"])
+
+    def test_units_done_are_skipped_by_key(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.advance("step", "a")
+        checkpoint.mark_done("step", ["b"], "y", "x")
+        checkpoint.save()
+        resumed = Checkpoint(self.path)
+        self.assertEqual(resumed.pending("step", ["a", "b", "c"], key=str), ["b", "c"])
+        self.assertEqual(resumed.pending("step", ["z", "x", "w"], key=str, parents=["b"]), ["z", "w"])
+        self.assertTrue(resumed.is_done("step", ["b"], "x", "y"))
+        self.assertFalse(resumed.is_done("step", ["b"], "x", "z"))
+        resumed.advance("step", "b")
+        self.assertEqual(resumed.pending("step", ["a", "b", "c"], key=str), ["c"])
+        self.assertFalse(resumed.is_done("step", ["b"], "x"))
+
+    def test_unknown_cursors_skip_nothing(self):
+        checkpoint = Checkpoint(None)
+        checkpoint.advance("step", "d")
+        self.assertEqual(checkpoint.pending("step", ["a", "b", "c"], key=str), ["a", "b", "c"])
+
+    def test_clear(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.complete("step1")
+        self.assertTrue(self.path.exists())
+        checkpoint.clear()
+        self.assertFalse(self.path.exists())
+        self.assertFalse(Checkpoint(self.path).is_completed("step1"))
+
+    def test_checkpoints_of_reset_repositories_are_discarded(self):
+        repo = git.Repo.init(self.directory.name)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "test")
+            config.set_value("user", "email", "test@kgfiller")
+        repo.git.commit("--allow-empty", "-m", "begin")
+        repo.git.tag("begin")
+        checkpoint = Checkpoint(self.path, repo=repo)
+        checkpoint.complete("step1")
+        repo.git.commit("--allow-empty", "-m", "step1")
+        self.assertTrue(Checkpoint(self.path, repo=repo).is_completed("step1"))
+        checkpoint.advance("step2", "a")
+        checkpoint.save()
+        repo.git.checkout("begin")
+        repo.git.checkout("-b", "experiment")
+        with self.assertLogs(logger, level="WARNING"):
+            resumed = Checkpoint(self.path, repo=repo)
+        self.assertFalse(resumed.is_completed("step1"))
+        self.assertEqual(resumed.pending("step2", ["a", "b"], key=str), ["a", "b"])
+        self.assertFalse(self.path.exists())
+        repo.close()
@@ -0,0 +1,50 @@
+import pathlib
+import tempfile
+import unittest
+import git
+from kgfiller import Commit
+from kgfiller.git import DataRepository
+
+
+class TestDataRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        repo = git.Repo.init(self.path)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "test")
+            config.set_value("user", "email", "test@kgfiller")
+        self.file = self.path / "ontology.owl"
+        self.file.write_text("0")
+        repo.git.add(self.file.name)
+        repo.git.commit("-m", "begin")
+        repo.close()
+        self.saves = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def save(self):
+        self.saves += 1
+        self.file.write_text(str(self.saves))
+
+    def commits(self) -> int:
+        with git.Repo(self.path) as repo:
+            return int(repo.git.rev_list("--count", "HEAD"))
+
+    def test_batches_are_committed_on_exit(self):
+        with DataRepository(self.path, commit_every=3) as repo:
+            for i in range(4):
+                repo.maybe_commit(Commit(f"edit {i}", [self.file]), self.save)
+            self.assertEqual((self.commits(), self.saves), (2, 1))
+        self.assertEqual((self.commits(), self.saves), (3, 2))
+
+    def test_errors_are_not_hidden_by_callbacks(self):
+        def fail():
+            raise RuntimeError("closed")
+        with self.assertRaises(KeyError):
+            with DataRepository(self.path, commit_every=3) as repo:
+                repo.maybe_commit(Commit("edit", [self.file]), fail)
+                raise KeyError("original")
+        self.assertEqual(self.commits(), 1)
@@ -0,0 +1,50 @@
+import pathlib
+import tempfile
+import unittest
+from kgfiller.journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "journal.jsonl"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_are_appended(self):
+        journal = Journal(self.path)
+        journal.append("add_instances", names=["apple", "pear"], **{"class": "Fruit"})
+        journal.append("destroy_instance", instance="pear")
+        journal.close()
+        self.assertEqual(Journal(self.path).records(), [
+            {"op": "add_instances", "names": ["apple", "pear"], "class": "Fruit"},
+            {"op": "destroy_instance", "instance": "pear"},
+        ])
+
+    def test_records_since_last_save(self):
+        journal = Journal(self.path)
+        journal.append("destroy_instance", instance="apple")
+        journal.saved()
+        journal.append("destroy_instance", instance="pear")
+        self.assertEqual(journal.records(since_last_save=True), [{"op": "destroy_instance", "instance": "pear"}])
+        self.assertEqual(len(journal.records()), 3)
+        journal.close()
+
+    def test_truncated_lines_are_ignored(self):
+        journal = Journal(self.path)
+        journal.append("destroy_instance", instance="apple")
+        journal.close()
+        with open(self.path, "a") as file:
+            file.write('{"op":"destroy_ins')
+        self.assertEqual(Journal(self.path).records(), [{"op": "destroy_instance", "instance": "apple"}])
+
+    def test_compaction_upon_save(self):
+        journal = Journal(self.path, max_size=1)
+        journal.append("destroy_instance", instance="apple")
+        journal.saved()
+        self.assertEqual(journal.records(), [])
+        journal.append("destroy_instance", instance="pear")
+        journal.close()
+        self.assertEqual(Journal(self.path).records(), [{"op": "destroy_instance", "instance": "pear"}])
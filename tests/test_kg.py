@@ -0,0 +1,180 @@
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import owlready2 as owlready
+from kgfiller.journal import Journal
+from kgfiller.kg import KnowledgeGraph, SAVE_FORMATS, save_ontology
+
+
+class TestKnowledgeGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "ontology.owl"
+        world = owlready.World()
+        onto = world.get_ontology("http://www.example.org/test-kg.owl#")
+        with onto:
+            Edible = owlready.types.new_class("Edible", (owlready.Thing,))
+            Fruit = owlready.types.new_class("Fruit", (Edible,))
+            owlready.types.new_class("Apple", (Fruit,))
+            owlready.types.new_class("Recipe", (Edible,))
+            ingredientOf = owlready.types.new_class("ingredientOf", (owlready.ObjectProperty,))
+            ingredientOf.domain = [Edible]
+            ingredientOf.range = [Edible]
+            owlready.types.new_class("fancyName", (owlready.DataProperty,))
+            Fruit("pear")
+        onto.save(str(self.path))
+        world.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def knowledge_graph(self, journal_file: str = "", quadstore_file: str = "ontology.sqlite3", **kwargs) -> KnowledgeGraph:
+        # each quadstore has its own world, hence tests do not share entities via owlready's default world
+        return KnowledgeGraph(self.path, journal_file=journal_file, quadstore_file=quadstore_file, **kwargs)
+
+    def test_add_instances_reuses_existing_ones(self):
+        with self.knowledge_graph() as kg:
+            added = kg.add_instances(kg.onto.Fruit, ["Pear", "Green apple", "green apple"])
+            self.assertEqual([a.created for a in added], [False, True, False])
+            self.assertIs(added[1].instance, added[2].instance)
+            self.assertEqual(kg.direct_instances(kg.onto.Fruit), [added[0].instance, added[1].instance])
+            kg.set_class_of_instance(added[1].instance, kg.onto.Apple)
+            self.assertEqual(kg.direct_instances(kg.onto.Fruit), [added[0].instance])
+            self.assertTrue(kg.subtype(kg.onto.Apple, kg.onto.Edible, strict=True))
+
+    def test_add_instances_to_other_classes_creates_nothing(self):
+        with self.knowledge_graph() as kg:
+            pear = kg.onto["pear"]
+            added = kg.add_instances(kg.onto.Recipe, ["Pear", "Pie"])
+            self.assertEqual([a.created for a in added], [False, True])
+            self.assertIs(added[0].instance, pear)
+            self.assertEqual(set(pear.is_a), {kg.onto.Fruit, kg.onto.Recipe})
+
+    def test_merged_instances_leave_the_cached_property_values(self):
+        with self.knowledge_graph() as kg:
+            pear = kg.onto["pear"]
+            pie, tart = kg.add_instance(kg.onto.Recipe, "pie"), kg.add_instance(kg.onto.Recipe, "tart")
+            kg.add_property(pear, "ingredientOf", pie)
+            kg.add_property(pie, "ingredientOf", tart)
+            kg.add_property(tart, "ingredientOf", tart)
+            self.assertTrue(kg.merge_instances(tart, pie, kg.onto.Recipe))
+            self.assertNotIn((pie, "ingredientOf"), kg._property_values)
+            self.assertEqual(kg._property_values[(pear, "ingredientOf")], set())
+            self.assertEqual(kg._property_values[(tart, "ingredientOf")], {tart})
+            mutations = kg._mutations
+            kg.add_property(tart, "ingredientOf", tart)
+            self.assertEqual(kg._mutations, mutations)
+            kg.add_property(pear, "ingredientOf", tart)
+            self.assertEqual(pear.ingredientOf, [tart])
+
+    def test_hierarchy_follows_class_edits(self):
+        with self.knowledge_graph(journal_file="journal.jsonl") as kg:
+            self.assertTrue(kg.is_leaf(kg.onto.Apple))
+            self.assertFalse(kg.subtype(kg.onto.Apple, kg.onto.Recipe))
+            self.assertEqual(list(kg.visit_classes_depth_first(kg.onto.Recipe)), [kg.onto.Recipe])
+            pie = kg.add_class("Pie", [kg.onto.Apple])
+            self.assertFalse(kg.is_leaf(kg.onto.Apple))
+            self.assertTrue(kg.subtype(pie, kg.onto.Fruit, strict=True))
+            kg.add_property(kg.onto.Apple, "is_a", kg.onto.Recipe)
+            self.assertTrue(kg.subtype(pie, kg.onto.Recipe, strict=True))
+            self.assertTrue(kg.instance_of(kg.add_instance(pie, "Apple pie"), kg.onto.Recipe))
+            self.assertTrue(kg.supertype(kg.onto.Recipe, kg.onto.Apple, strict=True))
+            self.assertEqual(list(kg.visit_classes_depth_first(kg.onto.Recipe)), [pie, kg.onto.Apple, kg.onto.Recipe])
+        records = Journal(self.path.with_name("journal.jsonl")).records()
+        self.assertEqual(records[0], {"op": "add_class", "name": "Pie", "parents": [{"class": "Apple"}]})
+
+    def test_clean_graphs_are_not_saved(self):
+        before = self.path.read_bytes(), self.path.stat().st_mtime_ns
+        with self.knowledge_graph(journal_file="journal.jsonl") as kg:
+            with mock.patch.object(kg.onto.world, "save", wraps=kg.onto.world.save) as save:
+                self.assertFalse(kg.dirty)
+                kg.save()
+                kg.save_edits()
+                self.assertEqual(save.call_count, 0)
+        self.assertEqual((self.path.read_bytes(), self.path.stat().st_mtime_ns), before)
+        self.assertEqual(list(Journal(self.path.with_name("journal.jsonl")).records()), [])
+
+    def test_saves_every_mutations(self):
+        with self.knowledge_graph(save_every_mutations=2) as kg:
+            with mock.patch.object(kg.onto.world, "save", wraps=kg.onto.world.save) as save:
+                kg.add_instances(kg.onto.Fruit, ["banana"])
+                self.assertEqual((kg.dirty, save.call_count), (True, 0))
+                kg.add_instances(kg.onto.Fruit, ["cherry"])
+                self.assertEqual((kg.dirty, save.call_count), (False, 1))
+                kg.add_instances(kg.onto.Fruit, ["date"])
+                self.assertEqual((kg.dirty, save.call_count), (True, 1))
+                # periodic saves only reach the quadstore, the ontology file is written upon saving
+                self.assertEqual(kg._unexported, 3)
+                kg.save()
+                self.assertEqual((kg.dirty, save.call_count, kg._unexported), (False, 2, 0))
+
+    def test_saves_every_seconds(self):
+        with self.knowledge_graph(save_every_seconds=60) as kg:
+            with mock.patch.object(kg.onto.world, "save", wraps=kg.onto.world.save) as save:
+                with mock.patch("kgfiller.kg.time.monotonic", return_value=kg._last_save + 30):
+                    kg.add_instances(kg.onto.Fruit, ["banana"])
+                self.assertEqual((kg.dirty, save.call_count), (True, 0))
+                with mock.patch("kgfiller.kg.time.monotonic", return_value=kg._last_save + 60):
+                    kg.add_instances(kg.onto.Fruit, ["cherry"])
+                self.assertEqual((kg.dirty, save.call_count), (False, 1))
+
+    def test_unexported_edits_are_kept_by_the_quadstore(self):
+        before = self.path.read_bytes()
+        with self.knowledge_graph() as kg:
+            kg.add_instances(kg.onto.Fruit, ["Banana"])
+            kg.save(export=False)
+            kg._unexported = 0
+        self.assertEqual(self.path.read_bytes(), before)
+        with self.knowledge_graph() as kg:
+            self.assertIsNotNone(kg.onto["banana"])
+
+    def test_journal_marks_saves_of_the_ontology_file_only(self):
+        with self.knowledge_graph(journal_file="journal.jsonl") as kg:
+            kg.add_instances(kg.onto.Fruit, ["Banana"])
+            kg.save(export=False)
+            self.assertEqual([r["op"] for r in kg._journal.records(since_last_save=True)], ["add_instances"])
+            kg.save()
+            self.assertEqual(kg._journal.records(since_last_save=True), [])
+
+    def test_quadstore_is_rebuilt_when_the_ontology_changes(self):
+        with self.knowledge_graph() as kg:
+            kg.add_instances(kg.onto.Fruit, ["Banana"])
+        shutil.copy(self.path, self.path.with_name("backup.owl"))
+        with self.knowledge_graph() as kg:
+            kg.add_instances(kg.onto.Fruit, ["Cherry"])
+        shutil.copy(self.path.with_name("backup.owl"), self.path)
+        with self.knowledge_graph() as kg:
+            self.assertIsNotNone(kg.onto["banana"])
+            self.assertIsNone(kg.onto["cherry"])
+
+    def test_journal_replays_edits(self):
+        shutil.copy(self.path, self.path.with_name("initial.owl"))
+        with self.knowledge_graph(journal_file="journal.jsonl") as kg:
+            with kg.origin("query"):
+                pie = kg.add_instances(kg.onto.Recipe, ["Pie"])[0].instance
+                apple, apples = [a.instance for a in kg.add_instances(kg.onto.Fruit, ["Apple", "Apples"])]
+                kg.add_property(apple, "ingredientOf", pie)
+                kg.add_property(apples, "ingredientOf", pie)
+                kg.merge_instances(apple, apples, kg.onto.Fruit)
+            expected = sorted(i.name for i in kg.onto.individuals())
+        records = Journal(self.path.with_name("journal.jsonl")).records()
+        self.assertTrue(all(r["query"] == "query" for r in records if r["op"] != "save"))
+        shutil.copy(self.path.with_name("initial.owl"), self.path)
+        with self.knowledge_graph(quadstore_file="replayed.sqlite3") as kg:
+            self.assertEqual(kg.replay(records), 5)
+            self.assertEqual(sorted(i.name for i in kg.onto.individuals()), expected)
+            self.assertEqual(kg.onto["apple"].ingredientOf, [kg.onto["pie"]])
+
+    def test_saved_formats_load_back(self):
+        with self.knowledge_graph() as kg:
+            for format in SAVE_FORMATS:
+                path = self.path.with_name(f"ontology.{format}")
+                save_ontology(kg.onto, path, format)
+                world = owlready.World()
+                onto = world.get_ontology(path.as_uri()).load()
+                self.assertEqual([i.name for i in onto.individuals()], ["pear"])
+                self.assertEqual(set(c.name for c in onto.classes()), {"Edible", "Fruit", "Apple", "Recipe"})
+                world.close()
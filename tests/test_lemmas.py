@@ -0,0 +1,76 @@
+import importlib.util
+import pathlib
+import tempfile
+import unittest
+import warnings
+from kgfiller.lemmas import Lemmas, build, find_wordnet, known_words
+
+
+# excerpts of WordNet's index and exception files
+WORDNET = {
+    "index.noun": "  1 This software and database is being provided\n"
+                  "apple n 2 3 @ ~ + 2 1 07739125 12633994  \n"
+                  "box n 10 6 @ ~ #m #p %p + 10 2 02883344 13764213  \n"
+                  "goose n 3 4 @ ~ #m %p 3 2 01855672 07644967  \n"
+                  "mouse n 4 5 @ ~ #m #p %p 4 1 02330245 03793489  \n",
+    "index.verb": "run v 41 4 @ ~ * $ 41 21 01926311 01930264  \n",
+    "index.adj": "good a 21 4 ! & ^ = 21 15 01123148 01129977  \n"
+                 "late a 10 4 ! & ^ + 10 5 00816481 00819235  \n",
+    "index.adv": "well r 13 3 ! \\ ^ 13 7 00011093 00161932  \n",
+    "noun.exc": "geese goose\nmice mouse\nmen man\n",
+    "verb.exc": "ran run\n",
+    "adj.exc": "better good well\n",
+    "adv.exc": "best well\n",
+}
+
+
+class TestLemmas(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.wordnet = pathlib.Path(self.directory.name) / "wordnet"
+        self.wordnet.mkdir()
+        for name, content in WORDNET.items():
+            (self.wordnet / name).write_text(content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_known_words(self):
+        words = known_words(self.wordnet)
+        for word in ["apple", "apples", "box", "boxes", "goose", "geese", "gooses", "mice", "run", "runs", "ran",
+                     "good", "better", "late", "later", "latest", "well", "best"]:
+            self.assertIn(word, words)
+        # men is an exception, but to no known noun, and rules apply once, to words without exceptions
+        for word in ["men", "banana", "runnings", "box_"]:
+            self.assertNotIn(word, words)
+
+    def test_lookup(self):
+        path = pathlib.Path(self.directory.name) / "lemmas.txt"
+        self.assertEqual(build(path, self.wordnet), len(known_words(self.wordnet)))
+        lemmas = Lemmas(path)
+        for word in known_words(self.wordnet):
+            self.assertIn(word, lemmas)
+        for word in ["", "a", "apple_", "appl", "zzz", "men", "b"]:
+            self.assertNotIn(word, lemmas)
+
+    def test_empty_file(self):
+        path = pathlib.Path(self.directory.name) / "lemmas.txt"
+        path.write_bytes(b"")
+        self.assertNotIn("apple", Lemmas(path))
+
+    @unittest.skipIf(importlib.util.find_spec("nltk") is None, "nltk is not installed")
+    def test_same_words_as_nltk(self):
+        from nltk.corpus import wordnet
+        try:
+            words = known_words(find_wordnet())
+        except FileNotFoundError:
+            self.skipTest("WordNet is not installed for nltk")
+        candidates = sorted(words)[::1999] + ["apples", "geese", "mice", "men", "running", "ran", "better", "boxes",
+                                             "flies", "leaves", "dishes", "tomatoes", "spaghetti", "ice_cream",
+                                             "xyzzy", "appl", "bananae", "runnings", "kgfiller"]
+        with warnings.catch_warnings():
+            # about synsets missing from some versions of WordNet's data, irrelevant here
+            warnings.simplefilter("ignore")
+            for word in candidates:
+                self.assertEqual(word in words, len(wordnet.synsets(word)) > 0, word)
@@ -0,0 +1,181 @@
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import typing
+import unittest
+from unittest import mock
+import owlready2 as owlready
+import kgfiller.ai as ai
+from kgfiller import Commit
+from kgfiller.ai.cache import YamlQueryCache
+from kgfiller.checkpoint import Checkpoint
+from kgfiller.kg import KnowledgeGraph
+from kgfiller.pipeline import find_relation_instances, instances_for_classes, refine_food_instances
+from kgfiller.strategies import apply_concurrently
+from kgfiller.text import str_hash
+
+
+class SlowAiQuery(ai.AiQuery):
+    """Answers after a delay depending on the question, so that concurrent answers arrive out of order."""
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    threads = set()
+
+    def _chat_completion_step(self):
+        with SlowAiQuery.lock:
+            SlowAiQuery.active += 1
+            SlowAiQuery.max_active = max(SlowAiQuery.max_active, SlowAiQuery.active)
+            SlowAiQuery.threads.add(threading.current_thread().name)
+        time.sleep(0.01 * (int(str_hash(self.question), 16) % 5))
+        with SlowAiQuery.lock:
+            SlowAiQuery.active -= 1
+        # items shared among answers make the outcome depend on the order answers are applied in
+        subject = self.question.split(" for ")[-1].split(",")[0].split()[-1]
+        return {'text': f"1. {subject} cake\n2. Banana\n3. Apple {subject}\n4. Apple"}
+
+    @classmethod
+    def _limit_error(cls):
+        return []
+
+    def _chat_completion_to_dict(self, chat_completion) -> dict:
+        return chat_completion
+
+    def _extract_text_from_result(self, result) -> str:
+        return result['text']
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "ontology.owl"
+        world = owlready.World()
+        onto = world.get_ontology("http://www.example.org/test-pipeline.owl#")
+        with onto:
+            Edible = owlready.types.new_class("Edible", (owlready.Thing,))
+            Fruit = owlready.types.new_class("Fruit", (Edible,))
+            owlready.types.new_class("Apple", (Fruit,))
+            owlready.types.new_class("Recipe", (Edible,))
+            for name in ["x", "y", "z"]:
+                Fruit(name)
+        onto.save(str(self.path))
+        world.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_refinement_resumes_after_moved_instances(self):
+        step = refine_food_instances.__name__
+        refined = []
+
+        def move(kg, instance, cls, *args, **kwargs):
+            refined.append(instance.name)
+            return Commit(f"move {instance.name}", [kg.path])
+
+        with KnowledgeGraph(self.path, journal_file="", quadstore_file="ontology.sqlite3") as kg:
+            # interrupted after checking x, which stayed, and y, which was moved
+            checkpoint = Checkpoint(None)
+            checkpoint.advance(step, "Apple")
+            checkpoint.mark_done(step, ["Fruit"], "x")
+            kg.set_class_of_instance(kg.onto["y"], kg.onto.Apple)
+            checkpoint.mark_done(step, ["Fruit"], "y")
+            with mock.patch("kgfiller.pipeline.move_to_most_adequate_subclass", side_effect=move), \
+                    mock.patch("kgfiller.pipeline.maybe_commit"):
+                refine_food_instances(kg, None, {"rebalance": []}, checkpoint)
+        self.assertEqual(refined, ["z"])
+        self.assertEqual((checkpoint.step, checkpoint.cursor, checkpoint.done), (step, ["Edible"], []))
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "ontology.owl"
+        world = owlready.World()
+        onto = world.get_ontology("http://www.example.org/test-concurrency.owl#")
+        with onto:
+            Edible = owlready.types.new_class("Edible", (owlready.Thing,))
+            Fruit = owlready.types.new_class("Fruit", (Edible,))
+            Vegetable = owlready.types.new_class("Vegetable", (Edible,))
+            for name, parent in [("Citrus", Fruit), ("Berry", Fruit), ("Root", Vegetable), ("Leaf", Vegetable)]:
+                owlready.types.new_class(name, (parent,))
+            Recipe = owlready.types.new_class("Recipe", (Edible,))
+            ingredientOf = owlready.types.new_class("ingredientOf", (owlready.ObjectProperty,))
+            ingredientOf.domain = [Edible]
+            ingredientOf.range = [Edible]
+            owlready.types.new_class("fancyName", (owlready.AnnotationProperty,))
+            for name in ["pie", "tart", "crumble", "pudding", "sorbet", "jam", "salad"]:
+                Recipe(name)
+        onto.save(str(self.path))
+        world.close()
+        self.previous_api, ai.DEFAULT_API = ai.DEFAULT_API, SlowAiQuery
+        self.previous_cache = ai.DEFAULT_CACHE
+        SlowAiQuery.max_active = 0
+        SlowAiQuery.threads = set()
+
+    def tearDown(self):
+        ai.DEFAULT_API = self.previous_api
+        ai.DEFAULT_CACHE = self.previous_cache
+        self.directory.cleanup()
+
+    def run_with(self, parallelism: int, fill: typing.Callable[[KnowledgeGraph], typing.Iterable[Commit]]):
+        """The commits made by `fill` and the resulting individuals, starting over with a fresh ontology and cache."""
+        directory = pathlib.Path(self.directory.name) / f"run{parallelism}"
+        directory.mkdir()
+        shutil.copy(self.path, directory / self.path.name)
+        ai.DEFAULT_CACHE = YamlQueryCache(directory)
+        with KnowledgeGraph(directory / self.path.name, journal_file="", quadstore_file="ontology.sqlite3") as kg:
+            commits = [(c.message, c.description.replace(str(directory), "")) for c in fill(kg)]
+            individuals = sorted((i.name, sorted(c.name for c in i.is_a), sorted(i.fancyName),
+                                  sorted(o.name for o in i.ingredientOf)) for i in kg.onto.individuals())
+        return commits, individuals
+
+    def test_concurrent_plans_are_applied_in_order(self):
+        def fill(kg: KnowledgeGraph) -> typing.Iterable[Commit]:
+            classes = [cls for cls in kg.visit_classes_depth_first() if not kg.subtype(cls, kg.onto.Recipe)]
+            plans = instances_for_classes(kg, {"instance": ["instances list for class __CLASS_NAME_FANCY_, names only"]},
+                                          classes)
+            return apply_concurrently(plans, parallelism)
+
+        parallelism = 3
+        concurrent = self.run_with(parallelism, fill)
+        self.assertGreater(SlowAiQuery.max_active, 1)
+        parallelism = 1
+        sequential = self.run_with(parallelism, fill)
+        self.assertEqual(concurrent, sequential)
+        self.assertEqual([message.split()[-4] for message, _ in sequential[0]],
+                         ["Citrus", "Berry", "Fruit", "Root", "Leaf", "Vegetable", "Edible"])
+        # individuals found for a previous class are not created anew
+        self.assertIn("- Banana => adding instance banana to class Citrus", sequential[0][0][1])
+        self.assertIn("- Banana => instance banana already exists, classifying it as Berry", sequential[0][1][1])
+
+    def test_relations_are_resolved_concurrently_and_applied_by_one_writer(self):
+        writers = set()
+
+        def fill(kg: KnowledgeGraph) -> typing.Iterable[Commit]:
+            commits = []
+            add_property = kg.add_property
+
+            def write(*args, **kwargs):
+                writers.add(threading.current_thread().name)
+                return add_property(*args, **kwargs)
+
+            with mock.patch("kgfiller.pipeline.RELATION_PARALLELISM", parallelism), \
+                    mock.patch("kgfiller.pipeline.maybe_commit", side_effect=lambda *args: commits.append(args[-1])), \
+                    mock.patch.object(kg, "add_property", side_effect=write):
+                find_relation_instances(kg, None, {"relation": ["ingredient list for __INSTANCE_NAME_FANCY_, names only"]})
+            return commits
+
+        parallelism = 3
+        concurrent = self.run_with(parallelism, fill)
+        self.assertGreater(SlowAiQuery.max_active, 1)
+        self.assertTrue(all(name.startswith("kgfiller-query") for name in SlowAiQuery.threads))
+        self.assertEqual(writers, {threading.current_thread().name})
+        parallelism = 1
+        sequential = self.run_with(parallelism, fill)
+        self.assertEqual(concurrent, sequential)
+        self.assertEqual([message.split()[-4] for message, _ in sequential[0]],
+                         ["pie", "tart", "crumble", "pudding", "sorbet", "jam", "salad"])
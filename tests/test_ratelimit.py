@@ -0,0 +1,50 @@
+import os
+import time
+import unittest
+from kgfiller.ai.ratelimit import Backoff, TokenBucket, RateLimiter, rate_limiter, retry_after
+
+
+class ErrorWithHeaders(Exception):
+    def __init__(self, headers):
+        super().__init__("rate limit")
+        self.headers = headers
+
+
+class TestRateLimiting(unittest.TestCase):
+
+    def test_backoff_is_capped_and_jittered(self):
+        backoff = Backoff(initial=1, factor=2, cap=5, jitter=0.5)
+        delays = [backoff.next() for _ in range(6)]
+        for delay, nominal in zip(delays, [1, 2, 4, 5, 5, 5]):
+            self.assertLessEqual(delay, nominal)
+            self.assertGreaterEqual(delay, nominal / 2)
+
+    def test_bucket_allows_bursts_then_throttles(self):
+        bucket = TokenBucket(rate=60, capacity=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.reserve(), 1, delta=0.1)
+        self.assertAlmostEqual(bucket.reserve(), 2, delta=0.1)
+
+    def test_pause_is_shared(self):
+        limiter = RateLimiter()
+        limiter.pause(0.2)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_limiters_are_configured_per_api_and_model(self):
+        os.environ["RPM_TESTAPI_SOME_MODEL_1"] = "10"
+        try:
+            limiter = rate_limiter("testapi", "some-model-1")
+            self.assertIs(limiter, rate_limiter("testapi", "some-model-1"))
+            self.assertIsNotNone(limiter._requests)
+            self.assertIsNone(rate_limiter("testapi", "other-model")._requests)
+        finally:
+            del os.environ["RPM_TESTAPI_SOME_MODEL_1"]
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(ErrorWithHeaders({"retry-after": "7"})), 7)
+        self.assertEqual(retry_after(ErrorWithHeaders({"Retry-After": "1.5"})), 1.5)
+        self.assertIsNone(retry_after(ErrorWithHeaders({})))
+        self.assertIsNone(retry_after(ValueError()))
+        self.assertEqual(retry_after(ErrorWithHeaders({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0)
@@ -0,0 +1,52 @@
+import pathlib
+import tempfile
+import unittest
+import kgfiller.ai as ai
+from kgfiller.ai.cache import CacheRecord, YamlQueryCache, encode
+from kgfiller.ai.replay import ReplayAiQuery, RECORDED_API, synthetic_answer
+from kgfiller.text import itemize, str_hash
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_cache = ai.DEFAULT_CACHE
+        ai.DEFAULT_CACHE = YamlQueryCache(pathlib.Path(self.directory.name))
+
+    def tearDown(self):
+        ai.DEFAULT_CACHE = self.previous_cache
+        self.directory.cleanup()
+
+    def query(self, question: str) -> ai.AiQuery:
+        return ai.ai_query(question, model="gpt-3.5-turbo", background="You're a dietician", api=ReplayAiQuery)
+
+    def test_synthetic_answers_are_deterministic_lists(self):
+        question = "instances list for class Fruit, names only"
+        self.assertEqual(synthetic_answer(question), synthetic_answer(question))
+        self.assertGreaterEqual(len(itemize(synthetic_answer(question))), 3)
+        self.assertEqual(len(itemize(synthetic_answer("list of 20 famous Pasta dishes, concise names only"))), 20)
+
+    def test_synthetic_choices(self):
+        answer = synthetic_answer("most adequate class for 'apple' among: 'Fruit', 'Vegetable'. concise")
+        self.assertIn(answer, ['Fruit', 'Vegetable'])
+        self.assertIn(synthetic_answer("should apple and apples be merged? yes or no answer only"), ['Yes.', 'No.'])
+        for i in range(10):
+            answer = synthetic_answer(f"which ones among 'a{i}', 'b{i}', 'c{i}' are duplicates? "
+                                      "one group of duplicates per line, names only separated by vertical bars, or none")
+            self.assertTrue(answer == "None." or set(answer.split(" | ")) <= {f"a{i}", f"b{i}", f"c{i}"})
+
+    def test_recorded_answers_are_replayed(self):
+        query = self.query("ingredient list for Pizza, names only")
+        recorded_key = str_hash(query._id(RECORDED_API))
+        completion = {'choices': [{'message': {'content': '1. Dough\n2. Tomato\n3. Mozzarella'}}]}
+        ai.DEFAULT_CACHE.put(CacheRecord(recorded_key, "recorded", encode(completion)))
+        self.assertEqual(query.result_text, '1. Dough\n2. Tomato\n3. Mozzarella')
+        self.assertEqual(query.cache_key, recorded_key)
+
+    def test_synthetic_answers_are_cached_apart(self):
+        query = self.query("ingredient list for Carbonara, names only")
+        self.assertEqual(query.result_text, synthetic_answer(query.question))
+        self.assertNotEqual(query.cache_key, str_hash(query._id(RECORDED_API)))
+        self.assertTrue(query.cache_path.exists())
+        self.assertIn("api: ReplayAiQuery", query.cache_path.read_text())
@@ -0,0 +1,35 @@
+import unittest
+from kgfiller.strategies import parse_duplicates_cluster
+
+
+class TestDuplicatesCluster(unittest.TestCase):
+
+    def setUp(self):
+        self.instances_by_name = {"Salt and pepper": 1, "salt_and_pepper": 1, "salt and pepper": 1,
+                                  "Salt": 2, "salt": 2, "Pepper": 3, "pepper": 3,
+                                  "Pepper, black": 4, "pepper_black": 4, "pepper black": 4}
+
+    def parse(self, answer: str):
+        return parse_duplicates_cluster(answer, self.instances_by_name)
+
+    def test_names_with_separators_are_not_split(self):
+        self.assertEqual(self.parse("Salt and pepper | salt"), [[1, 2]])
+        self.assertEqual(self.parse("1. Pepper | Pepper, black\n2. Salt and pepper"), [[3, 4]])
+        self.assertEqual(self.parse("- 'pepper_black' | 'PEPPER'."), [[3, 4]])
+
+    def test_groups_are_sorted_and_deduplicated(self):
+        self.assertEqual(self.parse("pepper black | Salt | salt\n\nsalt and pepper | pepper"), [[2, 4], [1, 3]])
+
+    def test_none_is_admissible_only_when_said(self):
+        self.assertEqual(self.parse("None."), [])
+        self.assertEqual(self.parse("Salt\n- none"), [])
+        self.assertIsNone(self.parse("No idea, sorry"))
+        self.assertIsNone(self.parse("Salt | nonexistent"))
+        self.assertIsNone(self.parse("There are none among them"))
+
+    def test_prose_and_negative_answers_are_inadmissible(self):
+        self.assertIsNone(self.parse("Salt and Pepper, black are different."))
+        self.assertIsNone(self.parse("None of salt, pepper and pepper black should be merged."))
+        self.assertIsNone(self.parse("Salt | pepper are the same"))
+        self.assertIsNone(self.parse("Here are the duplicates:\nSalt | pepper"))
+        self.assertIsNone(self.parse("salt, pepper"))
@@ -0,0 +1,50 @@
+import random
+import unittest
+from difflib import SequenceMatcher
+import owlready2 as owlready
+from kgfiller.text import gather_possible_duplicates, gather_all_instances_of_class_without_subclasses, \
+    cluster_possible_duplicates
+
+
+def _brute_force_duplicates(cls):
+    all_instances = gather_all_instances_of_class_without_subclasses(cls)
+    return [(i1, i2) for index, i1 in enumerate(all_instances) for i2 in all_instances[index + 1:]
+            if SequenceMatcher(None, i1.name, i2.name).find_longest_match().size > 3]
+
+
+class TestDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.world = owlready.World()
+        self.onto = self.world.get_ontology("http://www.example.org/test-text.owl#")
+        with self.onto:
+            self.Food = owlready.types.new_class("Food", (owlready.Thing,))
+            self.Fruit = owlready.types.new_class("Fruit", (self.Food,))
+
+    def tearDown(self):
+        self.world.close()
+
+    def test_same_pairs_as_pairwise_comparison(self):
+        rnd = random.Random(0)
+        words = ["apple", "red_apple", "pie", "apple_pie", "pear", "pears", "banana", "ban", "nana", "lemon", "melon"]
+        for i in range(150):
+            name = "_".join(rnd.sample(words, rnd.randint(1, 2))) + f"_{i}"
+            self.Food(name)
+        for name in ["green_apple", "applesauce"]:
+            self.Fruit(name)
+        self.Food("apple_" + "ab" * 120)
+        self.Food("lemon_" + "pie_" * 60)
+        expected = _brute_force_duplicates(self.Food)
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(gather_possible_duplicates(self.Food), expected)
+
+    def test_short_names_are_never_duplicates(self):
+        for name in ["abc", "abcd_x", "xabc"]:
+            self.Food(name)
+        self.assertEqual(gather_possible_duplicates(self.Food), [])
+
+    def test_clusters_are_connected_components(self):
+        a, b, c, d, e = [self.Food(name) for name in "abcde"]
+        clusters = cluster_possible_duplicates([(a, b), (d, e), (b, c), (a, c)])
+        self.assertEqual(clusters, [([a, b, c], [(a, b), (b, c), (a, c)]), ([d, e], [(d, e)])])
+        self.assertEqual(cluster_possible_duplicates([]), [])
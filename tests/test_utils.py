@@ -0,0 +1,30 @@
+import pathlib
+import tempfile
+import unittest
+from kgfiller.utils import atomic_write
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / "file.txt"
+        self.path.write_text("before")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_files_are_replaced_once_written(self):
+        with atomic_write(self.path) as file:
+            file.write("after")
+            self.assertEqual(self.path.read_text(), "before")
+        self.assertEqual(self.path.read_text(), "after")
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path])
+
+    def test_failed_writes_leave_files_as_they_were(self):
+        with self.assertRaises(RuntimeError):
+            with atomic_write(self.path) as file:
+                file.write("after")
+                raise RuntimeError("interrupted")
+        self.assertEqual(self.path.read_text(), "before")
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path])